@@ -1,10 +1,29 @@
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 import open3d as o3d
 from fire import Fire
 
 from loguru import logger
 
+from mesh_header import probe_has_texcoords, probe_triangle_count
+from simplify_mesh import clean_mesh, decimate
+from tiled_simplify import simplify_tiled
+
+
+# Rough cost model used to bound concurrent jobs in the process pool.
+# Open3D keeps float64 positions/normals per vertex plus int32 faces, and
+# QEM adds per-vertex quadrics and an edge heap; ~400 B/triangle covers it.
+_BYTES_PER_TRI = 400
+# Used when the triangle count is unknown: compact binary meshes (GLB/STL/PLY)
+# spend roughly this many bytes of file per triangle.
+_FILE_BYTES_PER_TRI = 24
+
 
 def _simplify_one(
     in_path: Path,
@@ -13,31 +32,223 @@ def _simplify_one(
     min_tris_to_simplify: int = 10_000,
     min_target_tris: int = 500,
     smooth_iters: int = 0,
-) -> None:
+    tiles: int = 0,
+    method: str = "qem",
+    voxel_size: Optional[float] = None,
+    cleanup: bool = False,
+) -> Tuple[int, int]:
     """
     Simplify one mesh in-place using QEM decimation.
     - Skip if triangles < min_tris_to_simplify
     - Clamp target_tris to [min_target_tris, n_tris-1]
     - Optional smoothing
+    - tiles > 0: out-of-core tiled decimation (see tiled_simplify)
+    - method="cluster": vertex clustering instead of QEM
+    - cleanup: weld/drop degenerate and duplicate geometry before decimation
+    Returns (triangles before, triangles after).
     """
+    if tiles > 0:
+        n_header = probe_triangle_count(in_path)
+        if n_header is not None and n_header < min_tris_to_simplify:
+            return n_header, n_header
+        if probe_has_texcoords(in_path) is not False:
+            # Tiled output is bare geometry; overwriting would strip UVs/materials.
+            raise ValueError("tiles rewrites files as geometry only; refusing to "
+                             "overwrite a (possibly) textured mesh in place")
+        return simplify_tiled(str(in_path), str(in_path), int(target_tris),
+                              tiles=tiles, smooth_iters=smooth_iters,
+                              min_tris_to_simplify=min_tris_to_simplify,
+                              min_target_tris=min_target_tris)
+
     mesh = o3d.io.read_triangle_mesh(str(in_path))
-    mesh.compute_vertex_normals()
     n_tris = len(mesh.triangles)
+    if cleanup:
+        mesh, stats = clean_mesh(mesh)
+        logger.info(f"{in_path}: cleanup removed {stats}")
+    mesh.compute_vertex_normals()
 
-    if n_tris < min_tris_to_simplify:
-        return
+    if len(mesh.triangles) < min_tris_to_simplify:
+        return n_tris, n_tris
 
-    tgt = max(min_target_tris, min(int(target_tris), n_tris - 1))
-    if tgt >= n_tris:
-        return
+    tgt = max(min_target_tris, min(int(target_tris), len(mesh.triangles) - 1))
+    if tgt >= len(mesh.triangles):
+        return n_tris, n_tris
 
-    simplified = mesh.simplify_quadric_decimation(
-        target_number_of_triangles=tgt)
+    simplified = decimate(mesh, tgt, method, voxel_size)
     if smooth_iters > 0:
         simplified = simplified.filter_smooth_simple(
             number_of_iterations=smooth_iters)
 
     o3d.io.write_triangle_mesh(str(in_path), simplified)
+    return n_tris, len(simplified.triangles)
+
+
+def _hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _failed_record(in_path: Path, seconds: float,
+                   error: Optional[BaseException]) -> Dict:
+    return {"path": str(in_path), "before": None, "after": None,
+            "seconds": seconds, "error": f"{type(error).__name__}: {error}"}
+
+
+def _run_one(in_path: Path, target_tris: int, kwargs: Dict,
+             with_hash: bool = False) -> Dict:
+    """Run _simplify_one and return a summary record (never raises)."""
+    t0 = time.perf_counter()
+    record = {"path": str(in_path), "before": None,
+              "after": None, "seconds": 0.0, "error": None}
+    try:
+        record["before"], record["after"] = _simplify_one(
+            in_path, target_tris, **kwargs)
+        if with_hash:
+            st = in_path.stat()
+            record["size"], record["mtime_ns"] = st.st_size, st.st_mtime_ns
+            record["sha256"] = _hash_file(in_path)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = time.perf_counter() - t0
+    return record
+
+
+def _load_manifest(path: Path) -> Dict[str, Dict]:
+    """Read a JSONL manifest; later lines win over earlier ones."""
+    entries: Dict[str, Dict] = {}
+    if not path.exists():
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                e = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # tolerate a torn last line from an interrupted run
+            entries[e["path"]] = e
+    return entries
+
+
+def _write_manifest(path: Path, entries: Dict[str, Dict]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for e in entries.values():
+            f.write(json.dumps(e) + "\n")
+    os.replace(tmp, path)
+
+
+def _is_unchanged(p: Path, entry: Optional[Dict], params: Dict) -> bool:
+    """
+    True if p matches its manifest entry: same parameters, same size and
+    either the same mtime or (after a touch/copy) the same content hash.
+    """
+    if entry is None or entry.get("params") != params:
+        return False
+    st = p.stat()
+    if st.st_size != entry["size"]:
+        return False
+    if st.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    return _hash_file(p) == entry["sha256"]
+
+
+def _estimate_mem_bytes(path: Path, n_tris: Optional[int] = None) -> int:
+    """Estimate peak memory needed to load and decimate one mesh."""
+    size = path.stat().st_size
+    if n_tris is None:
+        n_tris = size // _FILE_BYTES_PER_TRI
+    return size + n_tris * _BYTES_PER_TRI
+
+
+def _default_mem_budget() -> int:
+    """Half of the physical memory, or 4 GiB if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return 4 << 30
+
+
+def _log_summary(records: List[Dict], elapsed: float) -> None:
+    logger.info("Summary:")
+    for r in records:
+        if r["error"]:
+            logger.error(
+                f"  FAIL {r['path']} ({r['seconds']:.2f}s): {r['error']}")
+        else:
+            logger.info(
+                f"  {r['path']}: {r['before']} -> {r['after']} tris "
+                f"({r['seconds']:.2f}s)")
+    n_fail = sum(1 for r in records if r["error"])
+    total = sum(r["seconds"] for r in records)
+    logger.info(
+        f"{len(records)} file(s), {n_fail} failure(s), {elapsed:.2f}s elapsed, "
+        f"{total:.2f}s summed job time")
+
+
+def _run_all(paths: List[Path], target_tris: int, kwargs: Dict, workers: int,
+             mem_budget_gb: Optional[float], with_hash: bool,
+             collect: Callable[[Dict], None],
+             tri_counts: Dict[Path, Optional[int]]) -> None:
+    """Simplify paths serially or in a memory-bounded pool, feeding collect."""
+    if workers <= 1:
+        for p in paths:
+            logger.info(f"Simplifying: {p}")
+            collect(_run_one(p, target_tris, kwargs, with_hash))
+        return
+
+    budget = (int(mem_budget_gb * (1 << 30)) if mem_budget_gb
+              else _default_mem_budget())
+    # Largest jobs first so a big mesh is never starved at the tail.
+    pending = sorted(((_estimate_mem_bytes(p, tri_counts.get(p)), p)
+                      for p in paths),
+                     key=lambda x: x[0], reverse=True)
+    running: Dict[Future, Tuple[int, Path, float]] = {}
+    in_use = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while pending or running:
+            # Admit jobs while they fit; always admit one if nothing is running.
+            i = 0
+            while i < len(pending) and len(running) < workers:
+                est, p = pending[i]
+                if running and in_use + est > budget:
+                    i += 1
+                    continue
+                pending.pop(i)
+                logger.info(f"Simplifying: {p}")
+                running[pool.submit(_run_one, p, target_tris, kwargs,
+                                    with_hash)] = (est, p, time.perf_counter())
+                in_use += est
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for fut in done:
+                est, p, t = running.pop(fut)
+                in_use -= est
+                try:
+                    collect(fut.result())
+                except BrokenProcessPool as e:
+                    broken = True
+                    collect(_failed_record(p, time.perf_counter() - t, e))
+            if broken:
+                # A worker died (typically OOM-killed). The pool fails every
+                # job it was running and we can't tell which one did it, so
+                # record them all and carry on with a fresh pool.
+                for fut, (_, p, t) in running.items():
+                    collect(_failed_record(p, time.perf_counter() - t,
+                                           fut.exception()))
+                running.clear()
+                in_use = 0
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        pool.shutdown()
 
 
 def simplify_dir(
@@ -49,29 +260,97 @@ def simplify_dir(
     min_tris_to_simplify: int = 10_000,
     min_target_tris: int = 500,
     smooth_iters: int = 0,
+    workers: int = 1,
+    mem_budget_gb: Optional[float] = None,
+    manifest: Optional[str] = None,
+    tiles: int = 0,
+    method: str = "qem",
+    voxel_size: Optional[float] = None,
+    cleanup: bool = False,
 ) -> None:
     """
     Simplify all meshes under a directory in-place.
     - Recurses by default
     - Filters by extensions
+    - workers > 1 runs files in a process pool; concurrent jobs are capped so
+      their estimated memory stays within mem_budget_gb (default: half of RAM);
+      if a worker dies (e.g. OOM-killed) the jobs in flight are recorded as
+      failed and the rest continue on a fresh pool
+    - Logs a per-file summary (time, triangles before/after, failures)
+    - manifest: JSONL sidecar recording each output's hash and the parameters
+      used; files that still match their entry are skipped without decoding
+    - Files whose header reports fewer than min_tris_to_simplify triangles
+      (STL/GLB/glTF/PLY) are skipped without decoding
+    - tiles > 0 decimates each file out-of-core in a tiles^3 grid of cells;
+      it writes geometry only, so files with UVs/textures are refused
+    - method="cluster" uses fast vertex clustering (voxel_size, or derived
+      from target_tris) instead of QEM
+    - cleanup runs a vectorized weld/degenerate/duplicate-face pre-pass
     """
+    if tiles > 0 and method != "qem":
+        raise ValueError("tiles only supports method='qem'.")
+    if tiles > 0 and cleanup:
+        raise ValueError("tiles cannot be combined with cleanup.")
+
     root_p = Path(root)
     suffixes = {e.strip().lower() for e in exts.split(",") if e.strip()}
     it = root_p.rglob("*") if recursive else root_p.glob("*")
+    paths = [p for p in it if p.is_file() and p.suffix.lower() in suffixes]
+
+    kwargs = dict(
+        min_tris_to_simplify=min_tris_to_simplify,
+        min_target_tris=min_target_tris,
+        smooth_iters=smooth_iters,
+        tiles=tiles,
+        method=method,
+        voxel_size=voxel_size,
+        cleanup=cleanup,
+    )
+    records: List[Dict] = []
+
+    manifest_p = Path(manifest) if manifest else None
+    entries: Dict[str, Dict] = {}
+    manifest_f = None
+    if manifest_p is not None:
+        params = dict(kwargs, target_tris=int(target_tris))
+        entries = _load_manifest(manifest_p)
+        n_before = len(paths)
+        paths = [p for p in paths
+                 if not _is_unchanged(p, entries.get(str(p.resolve())), params)]
+        logger.info(
+            f"Manifest: skipping {n_before - len(paths)} unchanged file(s)")
+        manifest_f = open(manifest_p, "a", encoding="utf-8")
+
+    # Cheap header probe: drop small meshes before any full load.
+    tri_counts = {p: probe_triangle_count(p) for p in paths}
+    n_before = len(paths)
+    paths = [p for p in paths
+             if tri_counts[p] is None or tri_counts[p] >= min_tris_to_simplify]
+    logger.info(
+        f"Header probe: skipping {n_before - len(paths)} file(s) below "
+        f"{min_tris_to_simplify} triangles")
+
+    def _collect(record: Dict) -> None:
+        records.append(record)
+        if manifest_f is None or record["error"]:
+            return
+        key = str(Path(record["path"]).resolve())
+        entries[key] = {"path": key, "size": record["size"],
+                        "mtime_ns": record["mtime_ns"],
+                        "sha256": record["sha256"], "params": params}
+        # Append as we go so an interrupted run keeps its progress.
+        manifest_f.write(json.dumps(entries[key]) + "\n")
+        manifest_f.flush()
 
-    for p in it:
-        if not p.is_file():
-            continue
-        if p.suffix.lower() not in suffixes:
-            continue
-        logger.info(f"Simplifying: {p}")
-        _simplify_one(
-            p,
-            target_tris,
-            min_tris_to_simplify=min_tris_to_simplify,
-            min_target_tris=min_target_tris,
-            smooth_iters=smooth_iters,
-        )
+    t0 = time.perf_counter()
+    try:
+        _run_all(paths, target_tris, kwargs, workers, mem_budget_gb,
+                 manifest_f is not None, _collect, tri_counts)
+    finally:
+        if manifest_f is not None:
+            manifest_f.close()
+            _write_manifest(manifest_p, entries)
+        _log_summary(records, time.perf_counter() - t0)
 
 
 if __name__ == "__main__":
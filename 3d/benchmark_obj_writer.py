@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import trimesh
+from fire import Fire
+from loguru import logger
+
+from obj_writer import write_obj
+
+
+def _synthetic_mesh(n_faces: int, seed: int = 0):
+    """Random vertices (~n_faces / 2 of them, like a closed surface) and faces."""
+    rng = np.random.default_rng(seed)
+    n_verts = max(3, n_faces // 2)
+    vertices = rng.random((n_verts, 3), dtype=np.float32)
+    faces = rng.integers(0, n_verts, size=(n_faces, 3), dtype=np.int64)
+    return vertices, faces
+
+
+def _time(fn, path: str):
+    t0 = time.perf_counter()
+    fn(path)
+    dt = time.perf_counter() - t0
+    size = os.path.getsize(path)
+    os.remove(path)
+    return dt, size
+
+
+def benchmark(
+    sizes: Union[str, Sequence[float]] = "1e5,1e6,1e7",
+    out_dir: Optional[str] = None,
+    skip_trimesh_above: float = 1e7,
+) -> None:
+    """
+    Compare obj_writer against trimesh's OBJ export on synthetic meshes.
+
+    Args:
+        sizes: Face counts to test, e.g. "1e5,1e6,1e7".
+        out_dir: Scratch directory (default: a temp dir).
+        skip_trimesh_above: Don't run trimesh for larger meshes.
+    """
+    if isinstance(sizes, str):
+        sizes = [s for s in sizes.split(",") if s.strip()]
+    elif not isinstance(sizes, (list, tuple)):
+        sizes = [sizes]
+
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        path = os.path.join(tmp, "bench.obj")
+        for n in (int(float(s)) for s in sizes):
+            v, f = _synthetic_mesh(n)
+            runs = {
+                "obj_writer": lambda p: write_obj(p, v, f),
+                "obj_writer (no thread)":
+                    lambda p: write_obj(p, v, f, threaded=False),
+            }
+            if n <= skip_trimesh_above:
+                mesh = trimesh.Trimesh(v, f, process=False)
+                runs["trimesh"] = lambda p: mesh.export(p, file_type="obj")
+            for name, fn in runs.items():
+                dt, size = _time(fn, path)
+                logger.info(
+                    f"{n:>10,} faces  {name:<24} {dt:8.2f}s  "
+                    f"{size / dt / 1e6:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    Fire(benchmark)
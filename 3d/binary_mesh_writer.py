@@ -0,0 +1,110 @@
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+
+
+def write_ply(
+    path: str,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    *,
+    normals: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Write a binary little-endian PLY. Vertex and face records are built as
+    numpy structured arrays and written in one go each.
+    """
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if normals is not None:
+        fields += [("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4")]
+    vert = np.empty(len(vertices), dtype=fields)
+    vert["x"], vert["y"], vert["z"] = np.asarray(vertices, dtype="<f4").T
+    if normals is not None:
+        vert["nx"], vert["ny"], vert["nz"] = np.asarray(normals, dtype="<f4").T
+
+    face = np.empty(len(faces), dtype=[("n", "u1"), ("idx", "<i4", (3,))])
+    face["n"] = 3
+    face["idx"] = faces
+
+    header = ["ply", "format binary_little_endian 1.0",
+              f"element vertex {len(vert)}",
+              "property float x", "property float y", "property float z"]
+    if normals is not None:
+        header += ["property float nx", "property float ny", "property float nz"]
+    header += [f"element face {len(face)}",
+               "property list uchar int vertex_indices", "end_header"]
+
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        vert.tofile(f)
+        face.tofile(f)
+
+
+def write_glb(
+    path: str,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    *,
+    normals: Optional[np.ndarray] = None,
+    uvs: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Write a single-primitive binary glTF (GLB) with float32 attributes and
+    uint32 indices, all packed into one buffer.
+    """
+    arrays = [("POSITION", np.asarray(vertices, dtype="<f4"))]
+    if normals is not None:
+        arrays.append(("NORMAL", np.asarray(normals, dtype="<f4")))
+    if uvs is not None:
+        arrays.append(("TEXCOORD_0", np.asarray(uvs, dtype="<f4")))
+
+    blobs, views, accessors, attributes = [], [], [], {}
+    offset = 0
+
+    def add(blob: bytes, target: int) -> int:
+        nonlocal offset
+        views.append({"buffer": 0, "byteOffset": offset,
+                      "byteLength": len(blob), "target": target})
+        blobs.append(blob)
+        offset += len(blob)
+        return len(views) - 1
+
+    for name, arr in arrays:
+        view = add(arr.tobytes(), 34962)  # ARRAY_BUFFER
+        acc = {"bufferView": view, "componentType": 5126,  # FLOAT
+               "count": len(arr), "type": f"VEC{arr.shape[1]}"}
+        if name == "POSITION":
+            acc["min"] = arr.min(axis=0).tolist() if len(arr) else [0, 0, 0]
+            acc["max"] = arr.max(axis=0).tolist() if len(arr) else [0, 0, 0]
+        accessors.append(acc)
+        attributes[name] = len(accessors) - 1
+
+    idx = np.asarray(faces, dtype="<u4").ravel()
+    view = add(idx.tobytes(), 34963)  # ELEMENT_ARRAY_BUFFER
+    accessors.append({"bufferView": view, "componentType": 5125,  # UINT
+                      "count": len(idx), "type": "SCALAR"})
+
+    doc = {
+        "asset": {"version": "2.0"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [{"primitives": [{"attributes": attributes,
+                                    "indices": len(accessors) - 1}]}],
+        "accessors": accessors,
+        "bufferViews": views,
+        "buffers": [{"byteLength": offset}],
+    }
+    js = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+    js += b" " * (-len(js) % 4)
+    # Every view is a multiple of 4 bytes (float32/uint32), so no padding.
+    total = 12 + 8 + len(js) + 8 + offset
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sII", b"glTF", 2, total))
+        f.write(struct.pack("<I4s", len(js), b"JSON"))
+        f.write(js)
+        f.write(struct.pack("<I4s", offset, b"BIN\x00"))
+        for blob in blobs:
+            f.write(blob)
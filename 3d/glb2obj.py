@@ -1,11 +1,32 @@
+import hashlib
+import io
 import os
 import shutil
 import pathlib
-from typing import List
+import time
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from typing import Dict, List, Optional
 
+import numpy as np
 import trimesh
 from fire import Fire
 from loguru import logger
+from PIL import Image
+
+from binary_mesh_writer import write_ply
+from mesh_header import probe_texture_bytes
+from obj_writer import ObjWriter
+
+
+TEXTURE_STORE_DIR = "_textures"
+# Bytes written by a _StoredTexture in place of encoded image data; the
+# resolver recognises them and links the stored file instead.
+_STORE_MARKER = b"@@texture-store:"
+_LOCK_WAIT_SECONDS = 600
+# PIL format names accepted for texture_format.
+_TEXTURE_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP",
+                    "png": "PNG"}
 
 
 def _gather_glb_files(input_dir: str) -> List[str]:
@@ -19,10 +40,343 @@ def _gather_glb_files(input_dir: str) -> List[str]:
     return sorted(str(p) for p in files)
 
 
+class _StoredTexture:
+    """
+    Stand-in for a PIL image whose encoded bytes already live in the
+    texture store. trimesh's OBJ exporter only calls .format, .tobytes()
+    (for material dedup) and .save(), so this skips re-encoding.
+    """
+
+    def __init__(self, store_name: str, fmt: str):
+        self.store_name = store_name
+        self.format = fmt
+
+    def tobytes(self) -> bytes:
+        return self.store_name.encode()
+
+    def save(self, fp, format=None) -> None:
+        fp.write(_STORE_MARKER + self.store_name.encode())
+
+
+class _EncodedTexture:
+    """
+    Stand-in for a PIL image that has already been resized and encoded by
+    _process_textures; the exporter writes its bytes as-is instead of
+    encoding the full-size image again.
+    """
+
+    def __init__(self, data: bytes, fmt: str, size, mode: str):
+        self.data = data
+        self.format = fmt
+        self.size = size
+        self.mode = mode
+
+    def tobytes(self) -> bytes:
+        return self.data
+
+    def save(self, fp, format=None) -> None:
+        fp.write(self.data)
+
+
+def _encode_texture(
+    image: Image.Image,
+    max_size: Optional[int],
+    fmt: Optional[str],
+    quality: int,
+) -> _EncodedTexture:
+    """Downscale image to fit max_size and encode it (runs on a thread)."""
+    fmt = fmt or (image.format or "PNG").upper()
+    if max_size and max(image.size) > max_size:
+        image = image.copy()
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")  # JPEG has no alpha channel
+    buf = io.BytesIO()
+    if fmt in ("JPEG", "WEBP"):
+        image.save(buf, format=fmt, quality=quality)
+    else:
+        image.save(buf, format=fmt, optimize=True)
+    return _EncodedTexture(buf.getvalue(), fmt, image.size, image.mode)
+
+
+def _process_textures(
+    scene: trimesh.Scene,
+    max_size: Optional[int],
+    fmt: Optional[str],
+    quality: int,
+    threads: Optional[int],
+) -> int:
+    """
+    Resize/re-encode every texture in scene on a thread pool (PIL releases
+    the GIL while resampling and encoding) and swap in the encoded
+    results. Returns the total encoded size in bytes.
+    """
+    targets = []
+    for geom in scene.geometry.values():
+        material = getattr(geom.visual, "material", None)
+        if material is None:
+            continue
+        attr = "baseColorTexture" if hasattr(
+            material, "baseColorTexture") else "image"
+        image = getattr(material, attr, None)
+        if isinstance(image, Image.Image):
+            targets.append((material, attr, image))
+
+    # Materials may share one image object; encode it once.
+    unique = {id(image): image for _, _, image in targets}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {key: pool.submit(_encode_texture, image, max_size, fmt,
+                                    quality)
+                   for key, image in unique.items()}
+        encoded = {key: fut.result() for key, fut in futures.items()}
+    for material, attr, image in targets:
+        setattr(material, attr, encoded[id(image)])
+    return sum(len(e.data) for e in encoded.values())
+
+
+def _ensure_in_store(image, store_dir: str) -> _StoredTexture:
+    """
+    Content-address image by its pixels and make sure its encoded file
+    exists in store_dir. Only the first worker to claim a texture encodes
+    it; the others wait for the file to appear.
+    """
+    fmt = (image.format or "png").lower()
+    h = hashlib.sha256(f"{image.mode}{image.size}".encode())
+    h.update(image.tobytes())
+    name = f"{h.hexdigest()}.{fmt}"
+    final = os.path.join(store_dir, name)
+    if os.path.exists(final):
+        return _StoredTexture(name, fmt)
+
+    lock = final + ".lock"
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        deadline = time.monotonic() + _LOCK_WAIT_SECONDS
+        while not os.path.exists(final) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if os.path.exists(final):
+            return _StoredTexture(name, fmt)
+        logger.warning(f"Timed out waiting for {name}; encoding it here.")
+
+    buf = io.BytesIO()
+    image.save(buf, format=fmt.upper())
+    tmp = f"{final}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp, final)
+    try:
+        os.remove(lock)
+    except FileNotFoundError:
+        pass
+    return _StoredTexture(name, fmt)
+
+
+def _swap_in_stored_textures(scene: trimesh.Scene, store_dir: str) -> None:
+    for geom in scene.geometry.values():
+        material = getattr(geom.visual, "material", None)
+        if material is None:
+            continue
+        attr = "baseColorTexture" if hasattr(
+            material, "baseColorTexture") else "image"
+        image = getattr(material, attr, None)
+        if image is None or isinstance(image, _StoredTexture):
+            continue
+        setattr(material, attr, _ensure_in_store(image, store_dir))
+
+
+class _StoreResolver(trimesh.resolvers.FilePathResolver):
+    """
+    Writes OBJ/MTL normally but resolves texture placeholders against the
+    shared store: either hardlinks the stored file into the asset folder or
+    rewrites the MTL to reference it relatively.
+    """
+
+    def __init__(self, obj_path: str, store_dir: str, mode: str):
+        super().__init__(obj_path)
+        self.store_dir = store_dir
+        self.mode = mode
+        self.renames: Dict[str, str] = {}
+        self.mtl: Dict[str, bytes] = {}
+
+    def write(self, name, data):
+        if isinstance(data, bytes) and data.startswith(_STORE_MARKER):
+            stored = os.path.join(
+                self.store_dir, data[len(_STORE_MARKER):].decode())
+            if self.mode == "relative":
+                rel = os.path.relpath(stored, self.parent)
+                self.renames[name] = rel.replace(os.sep, "/")
+                return
+            target = self.absolute(name)
+            if os.path.exists(target):
+                os.remove(target)
+            try:
+                os.link(stored, target)
+            except OSError:
+                shutil.copyfile(stored, target)
+            return
+        if name.lower().endswith(".mtl"):
+            # Defer until all texture names are known.
+            self.mtl[name] = data if isinstance(data, bytes) else data.encode()
+            return
+        super().write(name, data)
+
+    def finalize(self) -> None:
+        for name, data in self.mtl.items():
+            text = data.decode("utf-8")
+            for old, new in self.renames.items():
+                text = text.replace(f"map_Kd {old}", f"map_Kd {new}")
+            super().write(name, text.encode("utf-8"))
+
+
+def _export_obj_fast(scene: trimesh.Scene, out_obj_path: str, resolver,
+                     include_normals: bool = True) -> None:
+    """
+    Write scene as OBJ with the chunked obj_writer; materials and textures
+    go through resolver the same way trimesh's exporter writes them, and
+    vertex colors become 'v x y z r g b' lines as in trimesh.
+    """
+    meshes = [m for m in scene.dump() if hasattr(m, "faces")]
+    files: Dict[str, bytes] = {}
+    mtl_parts: List[bytes] = []
+    names: Dict[int, str] = {}
+
+    # Resolve materials first: mtllib is only written if one is exported.
+    jobs = []
+    for m in meshes:
+        uv, material_name, colors = None, None, None
+        material = getattr(m.visual, "material", None)
+        if hasattr(m.visual, "uv") and material is not None:
+            if hasattr(material, "to_simple"):
+                material = material.to_simple()
+            key = hash(material)
+            if key not in names:
+                name = trimesh.util.unique_name(
+                    material.name, set(names.values()))
+                data, names[key] = material.to_obj(name=name)
+                for file_name, blob in data.items():
+                    if file_name.lower().endswith(".mtl"):
+                        mtl_parts.append(blob)
+                    else:
+                        files.setdefault(file_name, blob)
+            material_name = names[key]
+            if np.ndim(m.visual.uv) == 2:
+                uv = m.visual.uv
+        elif m.visual.kind in ("vertex", "face") and len(m.visual.vertex_colors):
+            colors = m.visual.vertex_colors[:, :3] / 255.0
+        jobs.append((m, uv, colors, material_name))
+
+    with ObjWriter(out_obj_path) as w:
+        if mtl_parts:
+            w.line("mtllib material.mtl")
+        for m, uv, colors, material_name in jobs:
+            w.add_mesh(m.vertices, m.faces, uvs=uv,
+                       normals=m.vertex_normals if include_normals else None,
+                       colors=colors, name=m.metadata.get("name"),
+                       material=material_name if mtl_parts else None)
+
+    if mtl_parts:
+        for file_name, blob in files.items():
+            resolver.write(file_name, blob)
+        resolver.write("material.mtl", b"\n\n".join(mtl_parts))
+
+
+def _export_binary(scene: trimesh.Scene, out_path: str, fmt: str) -> None:
+    """
+    "glb": re-pack the scene as a self-contained GLB (materials and textures
+    embedded). "ply": flatten to world-space geometry with vertex normals in
+    one binary PLY; materials are dropped.
+    """
+    if fmt == "glb":
+        scene.export(out_path, file_type="glb")
+        return
+    meshes = [m for m in scene.dump() if hasattr(m, "faces")]
+    mesh = trimesh.util.concatenate(meshes)
+    write_ply(out_path, mesh.vertices, mesh.faces, normals=mesh.vertex_normals)
+
+
+def _convert_one(
+    in_path: str,
+    output_dir: str,
+    overwrite: bool,
+    dedup_textures: bool,
+    texture_mode: str,
+    fast_writer: bool = True,
+    output_format: str = "obj",
+    texture_opts: Optional[dict] = None,
+) -> str:
+    """Convert one GLB/GLTF; returns a log line (raises on failure)."""
+    stem = pathlib.Path(in_path).stem
+    out_base_dir = os.path.join(output_dir, stem)
+    out_obj_path = os.path.join(out_base_dir, f"{stem}.{output_format}")
+    out_mtl_path = os.path.join(
+        out_base_dir, "material.mtl")  # trimesh 默认命名
+
+    if os.path.exists(out_base_dir):
+        if overwrite:
+            shutil.rmtree(out_base_dir)
+        else:
+            if os.path.exists(out_obj_path):
+                return f"Skip (exists): {out_obj_path}"
+
+    os.makedirs(out_base_dir, exist_ok=True)
+
+    # 读 Scene 以保留材质/贴图
+    scene_or_mesh = trimesh.load(in_path, force="scene")
+    scene = (
+        trimesh.Scene(scene_or_mesh)
+        if isinstance(scene_or_mesh, trimesh.Trimesh)
+        else scene_or_mesh
+    )
+
+    if output_format != "obj":
+        _export_binary(scene, out_obj_path, output_format)
+        return f"Converted: {in_path} -> {out_obj_path}"
+
+    savings = ""
+    if texture_opts:
+        # Only base-color textures are exported to OBJ; compare like for like.
+        before = probe_texture_bytes(in_path, base_color_only=True)
+        after = _process_textures(scene, **texture_opts)
+        if before:
+            savings = (f" (textures {before / 1e6:.2f} MB -> "
+                       f"{after / 1e6:.2f} MB, {1 - after / before:.0%} saved)")
+
+    # 导出到该资产子目录；trimesh 会在同目录写 material.mtl 和纹理
+    if dedup_textures:
+        store_dir = os.path.join(output_dir, TEXTURE_STORE_DIR)
+        _swap_in_stored_textures(scene, store_dir)
+        resolver = _StoreResolver(out_obj_path, store_dir, texture_mode)
+    else:
+        resolver = trimesh.resolvers.FilePathResolver(out_obj_path)
+    if fast_writer:
+        _export_obj_fast(scene, out_obj_path, resolver)
+    else:
+        scene.export(out_obj_path, file_type="obj",
+                     include_texture=True, resolver=resolver)
+    if dedup_textures:
+        resolver.finalize()
+
+    if not os.path.exists(out_mtl_path):
+        logger.warning(
+            f"No .mtl generated (may be untextured): {out_obj_path}")
+
+    return f"Converted: {in_path} -> {out_obj_path}{savings}"
+
+
 def convert_glb_to_obj(
     input_dir: str,
     output_dir: str,
     overwrite: bool = False,
+    workers: int = 1,
+    dedup_textures: bool = False,
+    texture_mode: str = "hardlink",
+    fast_writer: bool = True,
+    output_format: str = "obj",
+    max_texture_size: Optional[int] = None,
+    texture_format: Optional[str] = None,
+    texture_quality: int = 90,
+    texture_threads: Optional[int] = None,
 ):
     """
     Convert all GLB/GLTF files in input_dir to per-asset folders:
@@ -32,7 +386,42 @@ def convert_glb_to_obj(
         input_dir: Directory containing .glb/.gltf files.
         output_dir: Directory to save converted assets.
         overwrite: If True, remove existing per-asset folder before exporting.
+        workers: Number of processes converting files in parallel.
+        dedup_textures: Write each unique texture once into
+            <output_dir>/_textures/<sha256>.<ext> instead of per asset.
+        texture_mode: With dedup_textures, "hardlink" links stored textures
+            into each asset folder; "relative" points material.mtl at the
+            store instead (trimesh's own loader refuses paths outside the
+            asset folder, most DCC tools and viewers follow them).
+        fast_writer: Write OBJ text with the chunked numpy obj_writer
+            instead of trimesh's exporter. It always writes vertex normals
+            (computed if the file had none).
+        output_format: "obj" (default); "glb" for a self-contained binary
+            glTF with materials embedded; "ply" for flattened binary
+            geometry without materials. Texture options apply to OBJ only.
+        max_texture_size: Downscale textures so their longer side is at
+            most this many pixels (aspect ratio kept).
+        texture_format: Re-encode textures as "jpeg", "webp" or "png"
+            (default: keep each texture's format). JPEG drops alpha.
+        texture_quality: JPEG/WebP quality (1-100).
+        texture_threads: Threads resizing/encoding textures per asset
+            (default: CPU count).
     """
+    output_format = output_format.lower().lstrip(".")
+    if output_format not in ("obj", "ply", "glb"):
+        raise ValueError("output_format must be 'obj', 'ply' or 'glb'.")
+    if texture_mode not in ("hardlink", "relative"):
+        raise ValueError("texture_mode must be 'hardlink' or 'relative'.")
+    if texture_format is not None:
+        if texture_format.lower() not in _TEXTURE_FORMATS:
+            raise ValueError(
+                "texture_format must be 'jpeg', 'webp' or 'png'.")
+        texture_format = _TEXTURE_FORMATS[texture_format.lower()]
+    texture_opts = None
+    if max_texture_size or texture_format:
+        texture_opts = dict(max_size=max_texture_size, fmt=texture_format,
+                            quality=texture_quality, threads=texture_threads)
+
     os.makedirs(output_dir, exist_ok=True)
     glb_files = _gather_glb_files(input_dir)
 
@@ -42,39 +431,30 @@ def convert_glb_to_obj(
 
     logger.info(f"Found {len(glb_files)} GLB/GLTF file(s).")
 
-    for in_path in glb_files:
-        stem = pathlib.Path(in_path).stem
-        out_base_dir = os.path.join(output_dir, stem)
-        out_obj_path = os.path.join(out_base_dir, f"{stem}.obj")
-        out_mtl_path = os.path.join(
-            out_base_dir, "material.mtl")  # trimesh 默认命名
-
-        if os.path.exists(out_base_dir):
-            if overwrite:
-                shutil.rmtree(out_base_dir)
-            else:
-                if os.path.exists(out_obj_path):
-                    logger.warning(f"Skip (exists): {out_obj_path}")
-                    continue
-
-        os.makedirs(out_base_dir, exist_ok=True)
-
-        # 读 Scene 以保留材质/贴图
-        scene_or_mesh = trimesh.load(in_path, force="scene")
-        scene = (
-            trimesh.Scene(scene_or_mesh)
-            if isinstance(scene_or_mesh, trimesh.Trimesh)
-            else scene_or_mesh
-        )
-
-        # 导出到该资产子目录；trimesh 会在同目录写 material.mtl 和纹理
-        scene.export(out_obj_path, file_type="obj", include_texture=True)
-
-        if not os.path.exists(out_mtl_path):
-            logger.warning(
-                f"No .mtl generated (may be untextured): {out_obj_path}")
-
-        logger.info(f"Converted: {in_path} -> {out_obj_path}")
+    if dedup_textures:
+        store_dir = os.path.join(output_dir, TEXTURE_STORE_DIR)
+        os.makedirs(store_dir, exist_ok=True)
+        # Locks left behind by an interrupted run would stall the workers.
+        for p in pathlib.Path(store_dir).glob("*.lock"):
+            p.unlink()
+
+    args = (output_dir, overwrite, dedup_textures, texture_mode, fast_writer,
+            output_format, texture_opts)
+    if workers <= 1:
+        for in_path in glb_files:
+            try:
+                logger.info(_convert_one(in_path, *args))
+            except Exception as e:
+                logger.error(f"Failed to convert {in_path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_convert_one, p, *args): p
+                       for p in glb_files}
+            for fut in as_completed(futures):
+                try:
+                    logger.info(fut.result())
+                except Exception as e:
+                    logger.error(f"Failed to convert {futures[fut]}: {e}")
 
     logger.info("Done.")
 
@@ -0,0 +1,75 @@
+import os
+import zipfile
+from typing import Dict, Optional
+
+import numpy as np
+
+
+CACHE_SUFFIX = ".geom.npz"
+
+
+def cache_path(src: str) -> str:
+    """Sidecar cache path for a source mesh: <src>.geom.npz."""
+    return src + CACHE_SUFFIX
+
+
+def save_cache(src: str, **arrays: np.ndarray) -> str:
+    """
+    Save geometry arrays (e.g. vertices, faces, normals, uvs) next to src as
+    an uncompressed .npz, stamped with the source's size and mtime so stale
+    caches are ignored. Writes via a temp file so readers never see a torn
+    cache.
+    """
+    st = os.stat(src)
+    out = cache_path(src)
+    tmp = f"{out}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, _src_stat=np.array([st.st_size, st.st_mtime_ns],
+                                     dtype=np.int64), **arrays)
+    os.replace(tmp, out)
+    return out
+
+
+def _mmap_member(path: str, info: zipfile.ZipInfo) -> np.ndarray:
+    """Memory-map one stored (uncompressed) .npy member of a zip file."""
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        name_len, extra_len = np.frombuffer(local[26:30], dtype="<u2")
+        f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        raise ValueError(f"{info.filename}: object arrays cannot be mapped")
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran else "C")
+
+
+def load_cache(src: str, mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Load the cache for src if it exists and matches the source's size and
+    mtime; otherwise return None. With mmap=True arrays are memory-mapped
+    straight out of the .npz (np.load ignores mmap_mode for archives).
+    """
+    path = cache_path(src)
+    if not os.path.exists(path):
+        return None
+    st = os.stat(src)
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = {i.filename[:-len(".npy")]: i for i in zf.infolist()}
+        if not mmap or any(i.compress_type != zipfile.ZIP_STORED
+                           for i in infos.values()):
+            with np.load(path) as data:
+                arrays = {k: data[k] for k in data.files}
+        else:
+            arrays = {k: _mmap_member(path, i) for k, i in infos.items()}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        return None
+    stamp = arrays.pop("_src_stat", None)
+    if stamp is None or list(stamp) != [st.st_size, st.st_mtime_ns]:
+        return None
+    return arrays
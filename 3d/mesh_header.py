@@ -0,0 +1,256 @@
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Optional, Tuple, Union
+from urllib.parse import unquote
+
+import numpy as np
+
+# glTF primitive modes that produce triangles.
+_GLTF_TRIANGLES, _GLTF_TRIANGLE_STRIP, _GLTF_TRIANGLE_FAN = 4, 5, 6
+
+# Byte sizes of PLY scalar types.
+_PLY_SIZES = {
+    b"char": 1, b"uchar": 1, b"int8": 1, b"uint8": 1,
+    b"short": 2, b"ushort": 2, b"int16": 2, b"uint16": 2,
+    b"int": 4, b"uint": 4, b"int32": 4, b"uint32": 4,
+    b"float": 4, b"float32": 4, b"double": 8, b"float64": 8,
+}
+
+# Binary STL: 80-byte header, uint32 triangle count, then 50-byte records.
+STL_HEADER_SIZE = 84
+STL_RECORD = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+
+def binary_stl_count(path: Union[str, Path]) -> Optional[int]:
+    """Triangle count of a binary STL, or None if path is not one."""
+    size = Path(path).stat().st_size
+    if size < STL_HEADER_SIZE:
+        return None
+    with open(path, "rb") as f:
+        f.seek(80)
+        (n,) = struct.unpack("<I", f.read(4))
+    # ASCII STLs also start with "solid"; only trust the count if it fits.
+    return n if size == STL_HEADER_SIZE + STL_RECORD.itemsize * n else None
+
+
+def weld(corners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (k, 3) triangle corner positions -> unique vertices and (k // 3, 3)
+    faces. Corners are welded by their raw bytes; + 0.0 folds -0.0 into 0.0
+    so they weld together.
+    """
+    dtype = corners.dtype
+    corners = np.ascontiguousarray(corners + dtype.type(0.0))
+    keys = corners.view(np.dtype((np.void, corners.itemsize * 3))).ravel()
+    del corners
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return uniq.view(dtype).reshape(-1, 3), inverse.reshape(-1, 3)
+
+
+def _gltf_count(doc: dict) -> int:
+    accessors = doc.get("accessors", [])
+
+    def mesh_tris(mesh: dict) -> int:
+        total = 0
+        for prim in mesh.get("primitives", []):
+            mode = prim.get("mode", _GLTF_TRIANGLES)
+            if "indices" in prim:
+                n = accessors[prim["indices"]]["count"]
+            else:
+                n = accessors[prim["attributes"]["POSITION"]]["count"]
+            if mode == _GLTF_TRIANGLES:
+                total += n // 3
+            elif mode in (_GLTF_TRIANGLE_STRIP, _GLTF_TRIANGLE_FAN):
+                total += max(n - 2, 0)
+        return total
+
+    per_mesh = [mesh_tris(m) for m in doc.get("meshes", [])]
+    instanced = sum(per_mesh[n["mesh"]]
+                    for n in doc.get("nodes", []) if "mesh" in n)
+    # Loaders differ on whether instances are expanded; take the larger.
+    return max(sum(per_mesh), instanced)
+
+
+def _glb_json(path: Path) -> Optional[dict]:
+    with open(path, "rb") as f:
+        header = f.read(20)
+        if len(header) < 20 or header[:4] != b"glTF":
+            return None
+        chunk_len, chunk_type = struct.unpack("<I4s", header[12:20])
+        if chunk_type != b"JSON":
+            return None
+        return json.loads(f.read(chunk_len))
+
+
+def _ply_count(path: Path) -> Optional[int]:
+    """
+    Face count of a binary PLY whose faces are all triangles, else None.
+
+    The header only gives the number of faces, not their sizes. If the face
+    element holds just a vertex list, the file size is only consistent with
+    every face having three indices, so the count is trusted only when the
+    sizes add up (ASCII PLYs always return None).
+    """
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            return None
+        binary = False
+        elements = []  # [name, count, [property sizes or (count size, item size)]]
+        for _ in range(1000):  # headers are short; bail out on garbage
+            line = f.readline()
+            if not line or line.strip() == b"end_header":
+                break
+            parts = line.split()
+            if parts[:1] == [b"format"]:
+                binary = parts[1] in (b"binary_little_endian", b"binary_big_endian")
+            elif parts[:1] == [b"element"] and len(parts) == 3:
+                elements.append([parts[1], int(parts[2]), []])
+            elif parts[:2] == [b"property", b"list"] and elements:
+                elements[-1][2].append((_PLY_SIZES[parts[2]], _PLY_SIZES[parts[3]]))
+            elif parts[:1] == [b"property"] and elements:
+                elements[-1][2].append(_PLY_SIZES[parts[1]])
+        else:
+            return None
+        header_size = f.tell()
+    faces = next((e for e in elements if e[0] == b"face"), None)
+    if not binary or faces is None:
+        return None
+    body = 0
+    for name, count, props in elements:
+        if name == b"face" and len(props) == 1 and isinstance(props[0], tuple):
+            count_size, item_size = props[0]
+            body += count * (count_size + 3 * item_size)
+        elif any(isinstance(p, tuple) for p in props):
+            return None  # variable-size records elsewhere; can't check
+        else:
+            body += count * sum(props)
+    return faces[1] if header_size + body == path.stat().st_size else None
+
+
+def probe_triangle_count(path: Union[str, Path]) -> Optional[int]:
+    """
+    Read the triangle count from a mesh file's header without decoding
+    geometry. Supports binary STL, GLB/glTF (accessor counts) and binary
+    PLY (only when its size shows every face is a triangle). Returns None
+    when the format is unsupported, the count is unknown or the header
+    cannot be parsed.
+    """
+    path = Path(path)
+    ext = path.suffix.lower()
+    try:
+        if ext == ".stl":
+            return binary_stl_count(path)
+        if ext == ".glb":
+            doc = _glb_json(path)
+            return None if doc is None else _gltf_count(doc)
+        if ext == ".gltf":
+            with open(path, "r", encoding="utf-8") as f:
+                return _gltf_count(json.load(f))
+        if ext == ".ply":
+            return _ply_count(path)
+    except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+        return None
+    return None
+
+
+def probe_has_texcoords(path: Union[str, Path]) -> Optional[bool]:
+    """
+    Whether a mesh file carries UVs or textures, judged from its header
+    (GLB/glTF: TEXCOORD attributes or textures; PLY: u/v/s/t vertex
+    properties; STL: never). OBJ files are scanned for "vt" lines. Returns
+    None for unsupported formats or unreadable headers.
+    """
+    path = Path(path)
+    ext = path.suffix.lower()
+    try:
+        if ext == ".stl":
+            return False
+        if ext in (".glb", ".gltf"):
+            if ext == ".glb":
+                doc = _glb_json(path)
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+            if doc is None:
+                return None
+            return bool(doc.get("textures")) or any(
+                name.startswith("TEXCOORD")
+                for mesh in doc.get("meshes", [])
+                for prim in mesh.get("primitives", [])
+                for name in prim.get("attributes", {}))
+        if ext == ".ply":
+            with open(path, "rb") as f:
+                if f.readline().strip() != b"ply":
+                    return None
+                for _ in range(1000):
+                    parts = f.readline().split()
+                    if not parts or parts[0] == b"end_header":
+                        break
+                    if parts[0] == b"property" and parts[-1] in (
+                            b"u", b"v", b"s", b"t", b"texture_u", b"texture_v"):
+                        return True
+            return False
+        if ext == ".obj":
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return m[:3] == b"vt " or m.find(b"\nvt ") >= 0
+    except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+        return None
+    return None
+
+
+def _base_color_images(doc: dict) -> set:
+    """Indices of the images used as base-color (diffuse) textures."""
+    textures = doc.get("textures", [])
+    images = set()
+    for material in doc.get("materials", []):
+        refs = [material.get("pbrMetallicRoughness", {}).get("baseColorTexture"),
+                material.get("extensions", {})
+                .get("KHR_materials_pbrSpecularGlossiness", {}).get("diffuseTexture")]
+        for ref in refs:
+            if ref is not None and "source" in textures[ref["index"]]:
+                images.add(textures[ref["index"]]["source"])
+    return images
+
+
+def probe_texture_bytes(path: Union[str, Path], base_color_only: bool = False) -> Optional[int]:
+    """
+    Total encoded size of the images a GLB/glTF references: embedded
+    bufferViews, data URIs and external files next to the asset. With
+    base_color_only, only images used as base-color textures (the ones an
+    OBJ export keeps) are counted. Returns None when the header cannot be
+    parsed.
+    """
+    path = Path(path)
+    try:
+        if path.suffix.lower() == ".glb":
+            doc = _glb_json(path)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        if doc is None:
+            return None
+        views = doc.get("bufferViews", [])
+        total = 0
+        wanted = _base_color_images(doc) if base_color_only else None
+        for i, image in enumerate(doc.get("images", [])):
+            if wanted is not None and i not in wanted:
+                continue
+            if "bufferView" in image:
+                total += views[image["bufferView"]]["byteLength"]
+            elif image.get("uri", "").startswith("data:"):
+                payload = image["uri"].partition(",")[2]
+                total += len(payload) * 3 // 4
+            elif "uri" in image:
+                ext_path = path.parent / unquote(image["uri"])
+                if ext_path.exists():
+                    total += ext_path.stat().st_size
+        return total
+    except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+        return None
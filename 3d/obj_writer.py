@@ -0,0 +1,142 @@
+import queue
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+# Rows formatted per string-format call; bounds the size of each text chunk.
+CHUNK_ROWS = 100_000
+
+
+class ObjWriter:
+    """
+    Streaming OBJ writer fed from numpy arrays.
+
+    Rows are formatted in CHUNK_ROWS blocks with a single %-format call per
+    block and written to a buffered file, so the whole file never exists as
+    one string. With threaded=True the writes happen on a background thread
+    (file I/O releases the GIL) while the next block is being formatted.
+
+    Meshes added with add_mesh() get their own v/vt/vn blocks; face indices
+    are offset automatically. UVs and normals are per-vertex, as in trimesh.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        float_fmt: str = "%.9g",
+        threaded: bool = True,
+        buffer_size: int = 1 << 20,
+    ):
+        self.float_fmt = float_fmt
+        self._f = open(path, "w", encoding="utf-8", buffering=buffer_size)
+        self._n_v = 0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        if threaded:
+            # Small bound keeps at most a few formatted chunks in memory.
+            self._queue = queue.Queue(maxsize=4)
+            self._thread = threading.Thread(target=self._drain, daemon=True)
+            self._thread.start()
+
+    def _drain(self) -> None:
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            if self._error is None:
+                try:
+                    self._f.write(text)
+                except BaseException as e:  # surfaced by close()
+                    self._error = e
+
+    def _emit(self, text: str) -> None:
+        if self._queue is None:
+            self._f.write(text)
+        else:
+            self._queue.put(text)
+
+    def line(self, text: str) -> None:
+        self._emit(text + "\n")
+
+    def rows(self, prefix: str, arr: np.ndarray, fmt: str) -> None:
+        """
+        Write arr as '<prefix> <fmt> <fmt> ...' lines, one per row; fmt may
+        consume several columns (e.g. "%d/%d" takes two).
+        """
+        if len(arr) == 0:
+            return
+        per_row = arr.shape[1] // fmt.count("%")
+        row_fmt = prefix + " " + " ".join([fmt] * per_row) + "\n"
+        for start in range(0, len(arr), CHUNK_ROWS):
+            block = arr[start:start + CHUNK_ROWS]
+            self._emit((row_fmt * len(block)) % tuple(block.ravel().tolist()))
+
+    def add_mesh(
+        self,
+        vertices: np.ndarray,
+        faces: np.ndarray,
+        *,
+        uvs: Optional[np.ndarray] = None,
+        normals: Optional[np.ndarray] = None,
+        colors: Optional[np.ndarray] = None,
+        name: Optional[str] = None,
+        material: Optional[str] = None,
+    ) -> None:
+        """colors: optional per-vertex RGB in [0, 1], written as 'v x y z r g b'."""
+        if name:
+            self.line(f"o {name}")
+        if colors is not None:
+            self.rows("v", np.column_stack((vertices, colors)), self.float_fmt)
+        else:
+            self.rows("v", vertices, self.float_fmt)
+        if uvs is not None:
+            self.rows("vt", uvs, self.float_fmt)
+        if normals is not None:
+            self.rows("vn", normals, self.float_fmt)
+        if material:
+            self.line(f"usemtl {material}")
+
+        # vt/vn are per-vertex, so every corner repeats the same index.
+        idx = np.asarray(faces, dtype=np.int64) + (self._n_v + 1)
+        if uvs is not None and normals is not None:
+            self.rows("f", np.repeat(idx, 3, axis=1), "%d/%d/%d")
+        elif uvs is not None:
+            self.rows("f", np.repeat(idx, 2, axis=1), "%d/%d")
+        elif normals is not None:
+            self.rows("f", np.repeat(idx, 2, axis=1), "%d//%d")
+        else:
+            self.rows("f", idx, "%d")
+        self._n_v += len(vertices)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._f.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "ObjWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_obj(
+    path: str,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    *,
+    uvs: Optional[np.ndarray] = None,
+    normals: Optional[np.ndarray] = None,
+    threaded: bool = True,
+) -> None:
+    """Write a single mesh to an OBJ file (see ObjWriter)."""
+    with ObjWriter(path, threaded=threaded) as w:
+        w.add_mesh(vertices, faces, uvs=uvs, normals=normals)
@@ -1,15 +1,178 @@
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 import open3d as o3d
 from fire import Fire
+from loguru import logger
+
+from mesh_cache import load_cache, save_cache
+from mesh_header import probe_triangle_count
+from tiled_simplify import simplify_tiled
+
+
+def _parse_targets(targets: Union[int, str, Sequence[int]]) -> List[int]:
+    """Accept 5000, "50000,5000" or (50000, 5000); return descending ints."""
+    if isinstance(targets, str):
+        items = [t for t in targets.split(",") if t.strip()]
+    elif isinstance(targets, (list, tuple)):
+        items = list(targets)
+    else:
+        items = [targets]
+    return sorted({int(t) for t in items}, reverse=True)
+
+
+def clean_mesh(
+    mesh: o3d.geometry.TriangleMesh,
+) -> Tuple[o3d.geometry.TriangleMesh, Dict[str, int]]:
+    """
+    Vectorized cleanup before decimation: weld bit-identical vertices, drop
+    degenerate (repeated-index or zero-area) and duplicate triangles, and
+    compact away unreferenced vertices. Per-corner UVs, material ids and
+    vertex colors are carried along; normals are left for the caller to
+    recompute. Returns the cleaned mesh and counts of what was removed.
+    """
+    v = np.asarray(mesh.vertices)
+    f = np.asarray(mesh.triangles).astype(np.int64)
+    n_v, n_f = len(v), len(f)
+
+    # Weld: + 0.0 folds -0.0 into 0.0, then unique the raw 24-byte rows.
+    keys = np.ascontiguousarray(v + 0.0).view(np.dtype((np.void, 24))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    f = inverse.reshape(-1)[f]
+
+    keep = (f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 2] != f[:, 0])
+    vw = v[first]
+    area2 = np.linalg.norm(np.cross(vw[f[:, 1]] - vw[f[:, 0]],
+                                    vw[f[:, 2]] - vw[f[:, 0]]), axis=1)
+    keep &= area2 > 0
+    n_degenerate = int(n_f - keep.sum())
+
+    # Duplicates: same vertices in the same winding; keep the first. Faces are
+    # rotated to start at their smallest index, so a back face (double-sided
+    # cards, thin shells) is not a duplicate of its front.
+    kept = np.flatnonzero(keep)
+    fk = f[kept]
+    shift = np.argmin(fk, axis=1)[:, None] + np.arange(3)
+    fk = np.take_along_axis(fk, shift % 3, axis=1)
+    _, uniq = np.unique(fk, axis=0, return_index=True)
+    kept = np.sort(kept[uniq])
+    n_duplicate = int(keep.sum() - len(kept))
+    f = f[kept]
+
+    used = np.unique(f)
+    compact = np.full(len(first), -1, dtype=np.int64)
+    compact[used] = np.arange(len(used))
+    src = first[used]
+
+    out = o3d.geometry.TriangleMesh(
+        o3d.utility.Vector3dVector(v[src]),
+        o3d.utility.Vector3iVector(compact[f].astype(np.int32)))
+    if mesh.has_vertex_colors():
+        out.vertex_colors = o3d.utility.Vector3dVector(
+            np.asarray(mesh.vertex_colors)[src])
+    if mesh.has_triangle_uvs():
+        uvs = np.asarray(mesh.triangle_uvs).reshape(-1, 3, 2)[kept]
+        out.triangle_uvs = o3d.utility.Vector2dVector(uvs.reshape(-1, 2))
+    if mesh.has_triangle_material_ids():
+        out.triangle_material_ids = o3d.utility.IntVector(
+            np.asarray(mesh.triangle_material_ids)[kept])
+    out.textures = mesh.textures
+
+    stats = {
+        "welded_vertices": n_v - len(first),
+        "degenerate_faces": n_degenerate,
+        "duplicate_faces": n_duplicate,
+        "unreferenced_vertices": len(first) - len(used),
+    }
+    return out, stats
+
+
+def decimate(
+    mesh: o3d.geometry.TriangleMesh,
+    target_tris: int,
+    method: str = "qem",
+    voxel_size: Optional[float] = None,
+) -> o3d.geometry.TriangleMesh:
+    """
+    Reduce mesh to about target_tris triangles.
+
+    - "qem": quadric error decimation (slow, high quality).
+    - "cluster": vertex clustering on a voxel grid (near-linear, rough).
+      voxel_size defaults to the cell size at which a surface of this area
+      keeps about target_tris triangles (clustering leaves roughly
+      2.8 * area / voxel_size^2 of them).
+    """
+    if method == "qem":
+        return mesh.simplify_quadric_decimation(
+            target_number_of_triangles=target_tris)
+    if method == "cluster":
+        if voxel_size is None:
+            voxel_size = (2.8 * mesh.get_surface_area()
+                          / max(target_tris, 1)) ** 0.5
+        return mesh.simplify_vertex_clustering(
+            voxel_size=voxel_size,
+            contraction=o3d.geometry.SimplificationContraction.Average)
+    raise ValueError(f"Unknown method: {method!r} (use 'qem' or 'cluster').")
+
+
+def read_mesh(in_path: str, cache: bool = False) -> o3d.geometry.TriangleMesh:
+    """
+    Read a triangle mesh, optionally through the .geom.npz geometry cache
+    (see mesh_cache). The cache holds vertices, faces, per-corner UVs and
+    vertex colors; meshes with textures or materials are never cached, so
+    a cache hit returns the same mesh a full parse would.
+    """
+    if cache:
+        cached = load_cache(in_path)
+        if cached is not None:
+            # Open3D copies into its own vectors and wants writeable input.
+            mesh = o3d.geometry.TriangleMesh(
+                o3d.utility.Vector3dVector(np.array(cached["vertices"], np.float64)),
+                o3d.utility.Vector3iVector(np.array(cached["faces"], np.int32)))
+            if "triangle_uvs" in cached:
+                mesh.triangle_uvs = o3d.utility.Vector2dVector(
+                    np.array(cached["triangle_uvs"], np.float64))
+            if "vertex_colors" in cached:
+                mesh.vertex_colors = o3d.utility.Vector3dVector(
+                    np.array(cached["vertex_colors"], np.float64))
+            return mesh
+
+    mesh = o3d.io.read_triangle_mesh(in_path)
+    if cache and (mesh.has_textures() or mesh.has_triangle_material_ids()):
+        logger.info(f"{in_path}: has textures/materials; not caching it")
+    elif cache:
+        arrays = dict(vertices=np.asarray(mesh.vertices),
+                      faces=np.asarray(mesh.triangles))
+        if mesh.has_triangle_uvs():
+            arrays["triangle_uvs"] = np.asarray(mesh.triangle_uvs)
+        if mesh.has_vertex_colors():
+            arrays["vertex_colors"] = np.asarray(mesh.vertex_colors)
+        save_cache(in_path, **arrays)
+    return mesh
+
+
+def _lod_path(out_path: str, level: int) -> str:
+    p = Path(out_path)
+    return str(p.with_name(f"{p.stem}_lod{level}{p.suffix}"))
 
 
 def simplify_mesh(
     in_path: str,
     out_path: str,
-    target_tris: int,
+    target_tris: Optional[int] = None,
     *,
+    targets: Optional[Union[str, Sequence[int]]] = None,
     min_tris_to_simplify: int = 10_000,
     min_target_tris: int = 500,
     smooth_iters: int = 0,
+    tiles: int = 0,
+    tile_workers: Optional[int] = None,
+    method: str = "qem",
+    voxel_size: Optional[float] = None,
+    cleanup: bool = False,
+    cache: bool = False,
 ) -> None:
     """
     Simplify a mesh with QEM decimation.
@@ -18,27 +181,89 @@ def simplify_mesh(
     - Clamp target_tris into [min_target_tris, n_tris - 1].
     - If target >= original, skip.
     - Optionally smooth after decimation.
+
+    method: "qem" (default) or "cluster" for fast vertex clustering, which
+    uses voxel_size if given, else a size derived from the target.
+
+    cleanup: weld duplicate vertices and drop degenerate/duplicate faces
+    and unreferenced vertices before decimating (see clean_mesh).
+
+    cache: load geometry from <in_path>.geom.npz (memory-mapped) when it is
+    up to date, else parse the file and write the cache (see read_mesh).
+    Textured meshes bypass the cache.
+
+    targets: LOD pyramid instead of a single target, e.g. "50000,20000,5000".
+    The mesh is loaded once and each level is decimated from the previous
+    one; level i is written to <out stem>_lod<i><suffix>, largest first.
+
+    If the file header already shows fewer than min_tris_to_simplify
+    triangles and the output format matches, the input is copied as-is
+    without decoding it.
+
+    tiles: out-of-core mode for meshes larger than RAM. Triangles are
+    streamed (binary STL) into a tiles^3 grid, each cell is decimated in
+    its own process (tile_workers, default: all cores) with the seams
+    locked, and the cells are stitched back together.
     """
-    mesh = o3d.io.read_triangle_mesh(in_path)
-    mesh.compute_vertex_normals()
-    n_tris = len(mesh.triangles)
+    if targets is None and target_tris is None:
+        raise ValueError("Either target_tris or targets must be given.")
+    if tiles > 0 and targets is not None:
+        raise ValueError("tiles cannot be combined with targets.")
+    if tiles > 0 and method != "qem":
+        raise ValueError("tiles only supports method='qem'.")
+    if tiles > 0 and cleanup:
+        raise ValueError("tiles cannot be combined with cleanup.")
 
-    if n_tris < min_tris_to_simplify:
-        o3d.io.write_triangle_mesh(out_path, mesh)
+    if targets is None:
+        levels = [(out_path, int(target_tris))]
+    else:
+        levels = [(_lod_path(out_path, i), t)
+                  for i, t in enumerate(_parse_targets(targets))]
+
+    n_header = probe_triangle_count(in_path)
+    in_ext = Path(in_path).suffix.lower()
+    # .gltf may reference external buffers, so only copy self-contained files.
+    copyable = in_ext != ".gltf" and all(
+        Path(path).suffix.lower() == in_ext for path, _ in levels)
+    if n_header is not None and n_header < min_tris_to_simplify and copyable:
+        for path, _ in levels:
+            if not (Path(path).exists() and Path(path).samefile(in_path)):
+                shutil.copyfile(in_path, path)
+        return
+
+    if tiles > 0:
+        simplify_tiled(in_path, out_path, int(target_tris),
+                       tiles=tiles, workers=tile_workers,
+                       smooth_iters=smooth_iters,
+                       min_tris_to_simplify=min_tris_to_simplify,
+                       min_target_tris=min_target_tris)
         return
 
-    tgt = max(min_target_tris, min(int(target_tris), n_tris - 1))
-    if tgt >= n_tris:
-        o3d.io.write_triangle_mesh(out_path, mesh)
+    mesh = read_mesh(in_path, cache)
+    if cleanup:
+        mesh, stats = clean_mesh(mesh)
+        logger.info(f"Cleanup removed: {stats}")
+    mesh.compute_vertex_normals()
+
+    if len(mesh.triangles) < min_tris_to_simplify:
+        for path, _ in levels:
+            o3d.io.write_triangle_mesh(path, mesh)
         return
 
-    simplified = mesh.simplify_quadric_decimation(
-        target_number_of_triangles=tgt)
-    if smooth_iters > 0:
-        simplified = simplified.filter_smooth_simple(
-            number_of_iterations=smooth_iters)
+    # Each level starts from the previous (unsmoothed) level, so the cost is
+    # one full decimation pass plus a shrinking tail.
+    current = mesh
+    for path, target in levels:
+        n_tris = len(current.triangles)
+        tgt = max(min_target_tris, min(target, n_tris - 1))
+        if tgt < n_tris:
+            current = decimate(current, tgt, method, voxel_size)
 
-    o3d.io.write_triangle_mesh(out_path, simplified)
+        out = current
+        if smooth_iters > 0 and current is not mesh:
+            out = current.filter_smooth_simple(
+                number_of_iterations=smooth_iters)
+        o3d.io.write_triangle_mesh(path, out)
 
 
 def main():
@@ -6,15 +6,51 @@ from fire import Fire
 
 from loguru import logger
 
+from binary_mesh_writer import write_glb, write_ply
+from mesh_cache import load_cache, save_cache
+from mesh_header import STL_HEADER_SIZE, STL_RECORD, binary_stl_count, weld
+from obj_writer import write_obj
 
-def convert_stl_to_obj(input_dir: str, output_dir: str):
+
+def _load_binary_stl(path: str, n_tris: int):
+    """
+    Memory-map the triangle records and weld identical vertices.
+    Returns (vertices float32 (V, 3), faces int64 (F, 3)).
+    """
+    records = np.memmap(path, dtype=STL_RECORD, mode="r",
+                        offset=STL_HEADER_SIZE, shape=(n_tris,))
+    return weld(records["vertices"].reshape(-1, 3))
+
+
+_WRITERS = {"obj": write_obj, "ply": write_ply, "glb": write_glb}
+
+
+def convert_stl_to_obj(
+    input_dir: str,
+    output_dir: str,
+    fast: bool = True,
+    output_format: str = "obj",
+    cache: bool = False,
+):
     """
     Convert all STL files in the input directory to OBJ files in the output directory.
 
     Args:
         input_dir (str): Path to the directory containing STL files.
         output_dir (str): Path to the directory to save converted OBJ files.
+        fast (bool): Stream binary STLs through a memory-mapped numpy path
+            and write OBJ text with the chunked obj_writer. ASCII STLs are
+            still parsed by trimesh. fast=False uses trimesh end to end.
+        output_format (str): "obj" (default), or binary "ply" / "glb", which
+            are several times smaller and faster to load.
+        cache (bool): Keep welded geometry in an uncompressed
+            <name>.stl.geom.npz next to each input and reuse it (memory-
+            mapped) on later runs instead of re-parsing the STL.
     """
+    output_format = output_format.lower().lstrip(".")
+    if output_format not in _WRITERS:
+        raise ValueError("output_format must be 'obj', 'ply' or 'glb'.")
+
     # Ensure the output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
@@ -24,7 +60,7 @@ def convert_stl_to_obj(input_dir: str, output_dir: str):
     # Process each STL file
     for stl_file in stl_files:
         input_path = os.path.join(input_dir, stl_file)
-        output_file = os.path.splitext(stl_file)[0] + '.obj'
+        output_file = os.path.splitext(stl_file)[0] + '.' + output_format
         output_path = os.path.join(output_dir, output_file)
 
         if os.path.exists(output_path):
@@ -33,12 +69,28 @@ def convert_stl_to_obj(input_dir: str, output_dir: str):
             continue
 
         try:
-            # Load the STL file
-            mesh = trimesh.load_mesh(input_path)
+            if not fast:
+                # Load the STL file and export it with trimesh
+                mesh = trimesh.load_mesh(input_path)
+                mesh.export(output_path)
+                logger.info(f"Converted: {stl_file} -> {output_file}")
+                continue
+
+            cached = load_cache(input_path) if cache else None
+            if cached is not None:
+                vertices, faces = cached["vertices"], cached["faces"]
+            else:
+                n_tris = binary_stl_count(input_path)
+                if n_tris is not None:
+                    vertices, faces = _load_binary_stl(input_path, n_tris)
+                else:
+                    mesh = trimesh.load_mesh(input_path)
+                    vertices, faces = mesh.vertices, mesh.faces
+                if cache:
+                    save_cache(input_path, vertices=vertices, faces=faces)
 
-            # Export the mesh to OBJ format
-            mesh.export(output_path)
-            logger.info(f"Converted: {stl_file} -> {output_file}")
+            _WRITERS[output_format](output_path, vertices, faces)
+            logger.info(f"Converted (fast): {stl_file} -> {output_file}")
         except Exception as e:
             logger.error(f"Failed to convert {stl_file}: {e}")
 
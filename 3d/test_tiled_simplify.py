@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+o3d = pytest.importorskip("open3d")
+
+from tiled_simplify import _edges, decimate_locked, simplify_tiled
+
+
+def _noisy_sphere(level: int, sigma: float, seed: int = 0):
+    mesh = o3d.geometry.TriangleMesh.create_icosahedron().subdivide_midpoint(level)
+    mesh.remove_duplicated_vertices()
+    v = np.asarray(mesh.vertices)
+    v = v / np.linalg.norm(v, axis=1)[:, None]
+    v = v + np.random.default_rng(seed).normal(0, sigma, v.shape)
+    return v, np.asarray(mesh.triangles)
+
+
+def _grid(n: int):
+    xs, ys = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    v = np.column_stack([xs.ravel(), ys.ravel(), np.zeros(n * n)]).astype(float)
+    i = (np.arange(n - 1)[:, None] * n + np.arange(n - 1)).ravel()
+    f = np.concatenate([np.column_stack([i, i + n, i + 1]),
+                        np.column_stack([i + 1, i + n, i + n + 1])])
+    return v, f
+
+
+def _assert_manifold(v, f, closed: bool):
+    _, n_faces = np.unique(_edges(f), axis=0, return_counts=True)
+    assert len(np.unique(np.sort(f, axis=1), axis=0)) == len(f), "duplicate faces"
+    if closed:
+        assert (n_faces == 2).all(), "edges not shared by exactly two faces"
+        assert len(v) - len(n_faces) + len(f) == 2, "Euler characteristic != 2"
+    else:
+        assert (n_faces <= 2).all(), "non-manifold edges"
+
+
+@pytest.mark.parametrize("sigma", [0.001, 0.003, 0.01])
+@pytest.mark.parametrize("target", [1000, 5120])
+def test_decimate_noisy_sphere_stays_manifold(sigma, target):
+    v, f = _noisy_sphere(5, sigma)
+    v2, f2 = decimate_locked(v, f, np.zeros(len(v), dtype=bool), target)
+    assert len(f2) == target
+    _assert_manifold(v2, f2, closed=True)
+
+
+@pytest.mark.parametrize("lock_boundary", [False, True])
+def test_decimate_flat_grid_reaches_target(lock_boundary):
+    v, f = _grid(33)
+    locked = np.zeros(len(v), dtype=bool)
+    if lock_boundary:
+        locked = ((v[:, :2] == 0) | (v[:, :2] == 32)).any(axis=1)
+    v2, f2 = decimate_locked(v, f, locked, 200)
+    assert len(f2) == 200
+    _assert_manifold(v2, f2, closed=False)
+    # Locked vertices are neither moved nor removed.
+    kept = {tuple(p) for p in v2}
+    assert all(tuple(p) in kept for p in v[locked])
+
+
+def test_tiled_noisy_sphere_is_watertight(tmp_path):
+    v, f = _noisy_sphere(5, 0.003)
+    mesh = o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(v),
+                                     o3d.utility.Vector3iVector(f))
+    mesh.compute_triangle_normals()
+    in_path, out_path = str(tmp_path / "in.stl"), str(tmp_path / "out.ply")
+    o3d.io.write_triangle_mesh(in_path, mesh)
+
+    n_before, n_after = simplify_tiled(in_path, out_path, 4000, tiles=2, workers=1)
+    assert n_before == len(f) and n_after < n_before
+    out = o3d.io.read_triangle_mesh(out_path)
+    _assert_manifold(np.asarray(out.vertices), np.asarray(out.triangles), closed=True)
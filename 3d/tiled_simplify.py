@@ -0,0 +1,332 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import open3d as o3d
+from loguru import logger
+
+from mesh_header import STL_HEADER_SIZE, STL_RECORD, binary_stl_count, weld
+
+
+# Triangles streamed per chunk while partitioning (~36 MB of float32).
+_CHUNK_TRIS = 1_000_000
+
+
+def _edges(faces: np.ndarray) -> np.ndarray:
+    e = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    return np.sort(e, axis=1)
+
+
+def _face_quadrics(v: np.ndarray, f: np.ndarray) -> np.ndarray:
+    """Area-weighted plane quadrics, one flattened 4x4 per face."""
+    n = np.cross(v[f[:, 1]] - v[f[:, 0]], v[f[:, 2]] - v[f[:, 0]])
+    area = np.linalg.norm(n, axis=1)
+    unit = n / np.maximum(area, 1e-30)[:, None]
+    p = np.column_stack([unit, -np.einsum("ij,ij->i", unit, v[f[:, 0]])])
+    return (p[:, :, None] * p[:, None, :]).reshape(-1, 16) * (0.5 * area)[:, None]
+
+
+def decimate_locked(
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    locked: np.ndarray,
+    target_tris: int,
+    max_rounds: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    QEM half-edge-collapse decimation that never moves or removes locked
+    vertices. Collapses are applied in vectorized rounds: each vertex picks
+    its cheapest incident edge (scored against the summed quadrics of both
+    endpoints, ties broken by length and a fixed per-edge hash) and
+    mutually-picked edges that are not joined by another edge are collapsed
+    together, so each one only touches its own neighbourhood. Collapses
+    that break the link condition, flip a triangle or would leave a
+    duplicate face or non-manifold edge are rejected. max_rounds defaults
+    to a multiple of log2(faces / target_tris).
+    """
+    v = vertices.astype(np.float64)
+    f = faces.astype(np.int64)
+    locked = locked.astype(bool)
+    n_v = len(v)
+    if max_rounds is None:
+        # A round removes a roughly constant fraction of the collapsible edges.
+        halvings = np.log2(max(len(f), 1) / max(target_tris, 1))
+        max_rounds = 40 * (1 + max(0, int(np.ceil(halvings))))
+
+    q = np.zeros((n_v, 16))
+    fq = _face_quadrics(v, f)
+    for k in range(3):
+        np.add.at(q, f[:, k], fq)
+
+    # Edges whose collapse was refused; skipped until nothing else is left.
+    rejected = np.empty(0, dtype=np.int64)
+    retried = False
+    for _ in range(max_rounds):
+        excess = len(f) - target_tris
+        if excess <= 0:
+            break
+        keys, n_faces = np.unique(_edges(f) @ np.array([n_v, 1]),
+                                  return_counts=True)
+        # Adjacency over every edge, including ones that can't collapse: the
+        # neighbourhood and link checks below must see all of them.
+        src = np.concatenate([keys // n_v, keys % n_v])
+        dst = np.concatenate([keys % n_v, keys // n_v])
+        ok = (~(locked[keys // n_v] & locked[keys % n_v])
+              & ~np.isin(keys, rejected))
+        if not ok.any() and len(rejected) and not retried:
+            # Neighbourhoods have changed since; give rejected edges a retry.
+            rejected = np.empty(0, dtype=np.int64)
+            retried = True
+            continue
+        keys, n_faces = keys[ok], n_faces[ok]
+        a, b = keys // n_v, keys % n_v
+        if len(a) == 0:
+            break
+
+        qs = (q[a] + q[b]).reshape(-1, 4, 4)
+        ha = np.column_stack([v[a], np.ones(len(a))])
+        hb = np.column_stack([v[b], np.ones(len(b))])
+        cost_a = np.einsum("ni,nij,nj->n", ha, qs, ha)  # survivor a
+        cost_b = np.einsum("ni,nij,nj->n", hb, qs, hb)  # survivor b
+        keep_a = (cost_a <= cost_b) & ~locked[b] | locked[a]
+        cost = np.where(keep_a, cost_a, cost_b)
+        survivor = np.where(keep_a, a, b)
+        dropped = np.where(keep_a, b, a)
+
+        # Mutual-cheapest edges form a matching: no vertex is in two of them.
+        # Flat regions all cost 0; ranking those by index order would chain
+        # the picks so that only a handful are mutual.
+        length = np.einsum("ij,ij->i", v[a] - v[b], v[a] - v[b])
+        jitter = (keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+                  ) >> np.uint64(11)
+        rank = np.empty(len(a), dtype=np.int64)
+        rank[np.lexsort((jitter, length, cost))] = np.arange(len(a))
+        best = np.full(n_v, np.iinfo(np.int64).max)
+        np.minimum.at(best, a, rank)
+        np.minimum.at(best, b, rank)
+        idx = np.flatnonzero((best[a] == rank) & (best[b] == rank))
+
+        # Keep collapses a ring apart: where two chosen edges are joined by
+        # an edge, drop the costlier one so their link checks stay valid
+        # however the set is pruned later.
+        owner = np.full(n_v, -1, dtype=np.int64)
+        owner[a[idx]] = idx
+        owner[b[idx]] = idx
+        oa, ob = owner[src], owner[dst]
+        clash = (oa >= 0) & (ob >= 0) & (oa != ob)
+        drop = np.where(rank[oa[clash]] > rank[ob[clash]], oa[clash], ob[clash])
+        idx = np.setdiff1d(idx, drop)
+        owner.fill(-1)
+        owner[a[idx]] = idx
+        owner[b[idx]] = idx
+
+        # Link condition: the endpoints may only share the vertices opposite
+        # the edge, otherwise the collapse pinches the surface.
+        sel = (owner[src] >= 0) & (owner[src] != owner[dst])
+        pair, n_seen = np.unique(owner[src[sel]] * n_v + dst[sel],
+                                 return_counts=True)
+        shared = pair[n_seen == 2]
+        common = np.bincount(shared // n_v, minlength=len(a))
+        link_ok = common[idx] == n_faces[idx]
+        # Collapsing onto a locked vertex must not join it to another locked
+        # vertex it wasn't already adjacent to: that would fold a flap over
+        # the seam which the neighbouring cell builds as well.
+        locked_nb = np.bincount(src[locked[dst]], minlength=n_v)
+        locked_common = np.bincount(shared[locked[shared % n_v]] // n_v,
+                                    minlength=len(a))
+        onto_locked = locked[survivor[idx]]
+        link_ok &= ~onto_locked | (
+            locked_nb[dropped[idx]] - 1 == locked_common[idx])
+        rejected = np.union1d(rejected, keys[idx[~link_ok]])
+        idx = idx[link_ok]
+
+        # Each collapse removes ~2 triangles; don't overshoot the target.
+        idx = idx[np.argsort(cost[idx], kind="stable")][:max(1, excess // 2)]
+
+        # Check the result of the collapses actually applied: reject those
+        # that flip a surviving triangle or leave a duplicate face or an
+        # edge with more than two faces (the link test above misses a
+        # collapsed tetrahedral pocket). Repeat, as dropping a collapse
+        # restores the faces its neighbours see.
+        while len(idx):
+            remap = np.arange(n_v)
+            remap[dropped[idx]] = survivor[idx]
+            new_f = remap[f]
+            alive = ((new_f[:, 0] != new_f[:, 1]) & (new_f[:, 1] != new_f[:, 2])
+                     & (new_f[:, 2] != new_f[:, 0]))
+            check = np.flatnonzero((new_f != f).any(axis=1) & alive)
+            of, nf = f[check], new_f[check]
+            n_old = np.cross(v[of[:, 1]] - v[of[:, 0]], v[of[:, 2]] - v[of[:, 0]])
+            n_new = np.cross(v[nf[:, 1]] - v[nf[:, 0]], v[nf[:, 2]] - v[nf[:, 0]])
+            bad = np.zeros(n_v, dtype=bool)
+            bad[of[np.einsum("ij,ij->i", n_old, n_new) <= 0]] = True
+
+            kept = new_f[alive]
+            srt = np.sort(kept, axis=1)
+            srt = srt[np.lexsort(srt.T[::-1])]
+            same = np.flatnonzero((srt[1:] == srt[:-1]).all(axis=1))
+            bad[srt[same]] = True
+            e_keys, n_e = np.unique(_edges(kept) @ np.array([n_v, 1]),
+                                    return_counts=True)
+            crowded = e_keys[n_e > 2]
+            bad[crowded // n_v] = bad[crowded % n_v] = True
+            if not bad.any():
+                break
+            # Neighbourhoods are disjoint, so each bad vertex belongs to at
+            # most one collapse.
+            hit = bad[dropped[idx]] | bad[survivor[idx]]
+            if not hit.any():
+                break  # problems that predate this round; nothing to undo
+            rejected = np.union1d(rejected, keys[idx[hit]])
+            idx = idx[~hit]
+        if len(idx) == 0:
+            continue
+
+        retried = False
+        np.add.at(q, survivor[idx], q[dropped[idx]])
+        f = new_f[alive]
+
+    used = np.unique(f)
+    compact = np.full(n_v, -1, dtype=np.int64)
+    compact[used] = np.arange(len(used))
+    return v[used], compact[f]
+
+
+def _triangle_chunks(path: str) -> Callable[[], Iterator[np.ndarray]]:
+    """
+    Return a function yielding (k, 3, 3) float32 triangle chunks; each call
+    is a fresh pass. Binary STLs are streamed from disk on every pass; other
+    formats are loaded once and the passes reuse the loaded mesh.
+    """
+    n_header = binary_stl_count(path) if Path(path).suffix.lower() == ".stl" else None
+    if n_header is not None:
+        def stream() -> Iterator[np.ndarray]:
+            records = np.memmap(path, dtype=STL_RECORD, mode="r",
+                                offset=STL_HEADER_SIZE, shape=(n_header,))
+            for start in range(0, n_header, _CHUNK_TRIS):
+                yield np.array(records["vertices"][start:start + _CHUNK_TRIS])
+        return stream
+
+    logger.warning(
+        f"{path}: only binary STL is streamed; loading it whole to tile it.")
+    mesh = o3d.io.read_triangle_mesh(path)
+    v = np.asarray(mesh.vertices, dtype=np.float32)
+    f = np.asarray(mesh.triangles)
+    del mesh
+
+    def from_memory() -> Iterator[np.ndarray]:
+        for start in range(0, len(f), _CHUNK_TRIS):
+            yield v[f[start:start + _CHUNK_TRIS]]
+    return from_memory
+
+
+def _partition(path: str, tiles: int, tmp_dir: str) -> List[Tuple[str, int]]:
+    """Bucket triangles by centroid into a tiles^3 grid of raw files."""
+    chunks = _triangle_chunks(path)
+    lo = np.full(3, np.inf, dtype=np.float32)
+    hi = np.full(3, -np.inf, dtype=np.float32)
+    for tris in chunks():
+        lo = np.minimum(lo, tris.reshape(-1, 3).min(axis=0))
+        hi = np.maximum(hi, tris.reshape(-1, 3).max(axis=0))
+    size = np.maximum(hi - lo, 1e-12) / tiles
+
+    counts = np.zeros(tiles ** 3, dtype=np.int64)
+    files = {}
+    try:
+        for tris in chunks():
+            cell = np.clip(((tris.mean(axis=1) - lo) / size).astype(np.int64),
+                           0, tiles - 1)
+            cid = (cell[:, 0] * tiles + cell[:, 1]) * tiles + cell[:, 2]
+            order = np.argsort(cid, kind="stable")
+            cid, tris = cid[order], tris[order]
+            bounds = np.flatnonzero(np.diff(cid)) + 1
+            for group, start in zip(np.split(tris, bounds),
+                                    np.concatenate([[0], bounds])):
+                c = int(cid[start])
+                if c not in files:
+                    files[c] = open(os.path.join(tmp_dir, f"{c}.f32"), "wb")
+                group.tofile(files[c])
+                counts[c] += len(group)
+    finally:
+        for fh in files.values():
+            fh.close()
+    return [(os.path.join(tmp_dir, f"{c}.f32"), int(counts[c]))
+            for c in sorted(files)]
+
+
+def _simplify_cell(cell_path: str, target: int) -> Tuple[np.ndarray, np.ndarray]:
+    tris = np.fromfile(cell_path, dtype=np.float32).reshape(-1, 3)
+    v, f = weld(tris)
+    f = f[(f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 2] != f[:, 0])]
+    # Lock everything on the cell's open boundary: that is the seam shared
+    # with neighbouring cells (plus any boundary the mesh had to begin with).
+    e, cnt = np.unique(_edges(f), axis=0, return_counts=True)
+    locked = np.zeros(len(v), dtype=bool)
+    locked[e[cnt != 2].ravel()] = True
+    v, f = decimate_locked(v, f, locked, target)
+    return v.astype(np.float32), f
+
+
+def simplify_tiled(
+    in_path: str,
+    out_path: str,
+    target_tris: int,
+    *,
+    tiles: int = 4,
+    workers: Optional[int] = None,
+    smooth_iters: int = 0,
+    min_tris_to_simplify: int = 0,
+    min_target_tris: int = 0,
+) -> Tuple[int, int]:
+    """
+    Out-of-core decimation: stream triangles into a tiles^3 grid of cells on
+    disk, decimate each cell in a process pool with its seam vertices
+    locked, then weld the cells back into one mesh. Peak memory is bounded
+    by the largest cell (per worker) plus the decimated output. Seams stay
+    at full resolution, so very low targets are limited by seam length.
+
+    As in simplify_mesh, meshes below min_tris_to_simplify are left alone
+    and the target is clamped to [min_target_tris, n_tris - 1]. Both need
+    the triangle count, so they apply after partitioning; when out_path is
+    in_path nothing is written, otherwise the geometry is written unchanged.
+    Returns (triangles before, triangles after).
+    """
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(out_path))) as tmp_dir:
+        cells = _partition(in_path, tiles, tmp_dir)
+        n_tris = sum(c for _, c in cells)
+        logger.info(
+            f"Partitioned {n_tris} triangles into {len(cells)} cell(s) "
+            f"({time.perf_counter() - t0:.1f}s)")
+
+        target = max(min_target_tris, min(int(target_tris), n_tris - 1))
+        if n_tris < min_tris_to_simplify or target >= n_tris:
+            if os.path.abspath(in_path) == os.path.abspath(out_path):
+                return n_tris, n_tris
+            target = n_tris  # cells come back unchanged
+        ratio = target / max(n_tris, 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                _simplify_cell,
+                [p for p, _ in cells],
+                [max(1, int(round(c * ratio))) for _, c in cells]))
+
+    corners = np.concatenate([v[f] for v, f in results]).reshape(-1, 3)
+    del results
+    v, f = weld(corners)
+    mesh = o3d.geometry.TriangleMesh(
+        o3d.utility.Vector3dVector(v.astype(np.float64)),
+        o3d.utility.Vector3iVector(f.astype(np.int32)))
+    if smooth_iters > 0:
+        mesh = mesh.filter_smooth_simple(number_of_iterations=smooth_iters)
+    mesh.compute_vertex_normals()
+    o3d.io.write_triangle_mesh(out_path, mesh)
+    logger.info(
+        f"Tiled simplify: {n_tris} -> {len(f)} triangles "
+        f"({time.perf_counter() - t0:.1f}s)")
+    return n_tris, len(f)
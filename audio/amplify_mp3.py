@@ -1,15 +1,185 @@
+import mmap
+import os
+import shutil
 import subprocess
 from pathlib import Path
-from typing import Union
+from typing import Optional, Tuple, Union
 import fire
 from loguru import logger
 
-def amplify_mp3(input_path: str, db: Union[int, float]) -> None:
+# One global_gain step scales amplitude by 2 ** (1/4), i.e. 1.5 dB.
+GAIN_STEP_DB = 1.5
+
+# Layer III bitrates (kbps) by bitrate index, for MPEG-1 and MPEG-2/2.5.
+_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1).
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000),
+                 3: (44100, 48000, 32000)}
+
+
+def _frame_info(buf, pos: int) -> Optional[Tuple[int, bool, int, bool]]:
+    """
+    Parse the Layer III frame header at pos.
+
+    :return: (frame_length, mpeg1, channels, has_crc), or None if there is
+        no valid Layer III header at pos.
+    """
+    if pos + 4 > len(buf) or buf[pos] != 0xFF or (buf[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version = (buf[pos + 1] >> 3) & 0x3
+    layer = (buf[pos + 1] >> 1) & 0x3
+    bitrate_idx = buf[pos + 2] >> 4
+    rate_idx = (buf[pos + 2] >> 2) & 0x3
+    # Layer III only; reserved version, free-format and bad bitrates rejected.
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[1 if mpeg1 else 2][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    padding = (buf[pos + 2] >> 1) & 0x1
+    length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    channels = 1 if (buf[pos + 3] >> 6) == 3 else 2
+    has_crc = (buf[pos + 1] & 0x1) == 0
+    return length, mpeg1, channels, has_crc
+
+
+def _gain_bit_offsets(mpeg1: bool, channels: int):
+    """Bit offsets of every global_gain field within the side info."""
+    if mpeg1:
+        # main_data_begin(9) + private bits + scfsi(4 per channel)
+        start = 9 + (5 if channels == 1 else 3) + 4 * channels
+        granules, granule_bits = 2, 59
+    else:
+        # main_data_begin(8) + private bits
+        start = 8 + (1 if channels == 1 else 2)
+        granules, granule_bits = 1, 63
+    # global_gain follows part2_3_length(12) and big_values(9).
+    return [start + (g * channels + ch) * granule_bits + 21
+            for g in range(granules) for ch in range(channels)]
+
+
+def _crc16(data) -> int:
+    """MPEG audio CRC-16 (polynomial 0x8005, initial value 0xFFFF)."""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xFFFF
+    return crc
+
+
+def _id3v2_size(buf) -> int:
+    """Size of a leading ID3v2 tag (including any footer), else 0."""
+    if len(buf) < 10 or buf[:3] != b"ID3":
+        return 0
+    size = 0
+    for b in buf[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if buf[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _find_frame(buf, pos: int) -> int:
+    """Next position >= pos holding two consecutive valid frames, or -1."""
+    end = len(buf)
+    while pos < end - 4:
+        pos = buf.find(b"\xff", pos)
+        if pos < 0:
+            return -1
+        info = _frame_info(buf, pos)
+        if info is not None:
+            nxt = pos + info[0]
+            if nxt + 4 > end or _frame_info(buf, nxt) is not None:
+                return pos
+        pos += 1
+    return -1
+
+
+def apply_gain_steps(path: Union[str, Path], steps: int) -> Tuple[int, int]:
+    """
+    Add steps to every granule's global_gain in an MP3 file, in place and
+    without decoding (the mp3gain technique). Each step is 1.5 dB. CRCs of
+    protected frames are recomputed; the Xing/Info header frame is skipped.
+
+    :param path: MP3 file to modify.
+    :param steps: Gain change in 1.5 dB steps.
+    :return: (frames adjusted, granules clamped at the 0..255 range).
+    """
+    frames = clamped = 0
+    if os.path.getsize(path) == 0 or steps == 0:
+        return frames, clamped
+    with open(path, "r+b") as f, mmap.mmap(f.fileno(), 0) as buf:
+        pos = _find_frame(buf, _id3v2_size(buf))
+        while pos >= 0:
+            info = _frame_info(buf, pos)
+            if info is None or pos + info[0] > len(buf):
+                pos = _find_frame(buf, pos + 1)
+                continue
+            length, mpeg1, channels, has_crc = info
+            side = pos + 4 + (2 if has_crc else 0)
+            side_len = (17 if channels == 1 else 32) if mpeg1 else \
+                (9 if channels == 1 else 17)
+            tag_at = side + side_len
+            if buf[tag_at:tag_at + 4] in (b"Xing", b"Info"):
+                pos += length
+                continue
+
+            for bit in _gain_bit_offsets(mpeg1, channels):
+                byte = side + bit // 8
+                shift = 8 - bit % 8  # gain sits in bits [shift, shift + 8)
+                word = (buf[byte] << 8) | buf[byte + 1]
+                gain = (word >> shift) & 0xFF
+                new = gain + steps
+                if not 0 <= new <= 255:
+                    new = min(max(new, 0), 255)
+                    clamped += 1
+                word = (word & ~(0xFF << shift)) | (new << shift)
+                buf[byte] = word >> 8
+                buf[byte + 1] = word & 0xFF
+
+            if has_crc:
+                crc = _crc16(buf[pos + 2:pos + 4] + buf[side:side + side_len])
+                buf[pos + 4] = crc >> 8
+                buf[pos + 5] = crc & 0xFF
+            frames += 1
+            pos += length
+        buf.flush()
+    return frames, clamped
+
+
+def _amplify_ffmpeg(input_file: Path, output_path: Path, db: Union[int, float]) -> None:
+    # Construct the ffmpeg command
+    command = [
+        "ffmpeg",
+        "-i", str(input_file),
+        "-filter:a", f"volume={db}dB",
+        str(output_path)
+    ]
+
+    logger.info(f"Executing command: {' '.join(command)}")
+
+    # Execute the ffmpeg command
+    subprocess.run(command, check=True)
+
+
+def amplify_mp3(
+    input_path: str,
+    db: Union[int, float],
+    lossless: bool = True,
+    in_place: bool = False,
+) -> None:
     """
     Amplifies or attenuates the volume of an MP3 file.
-    
+
     :param input_path: Path to the input MP3 file.
     :param db: Decibel change. Positive values increase volume, negative values decrease volume.
+    :param lossless: When db is a multiple of 1.5, adjust the frames' global_gain
+        directly instead of re-encoding (no quality loss, I/O-bound). Other values
+        fall back to ffmpeg.
+    :param in_place: Modify input_path instead of writing <stem>_<db>dB.mp3.
     """
     try:
         # Create a Path object from the input path
@@ -18,18 +188,32 @@ def amplify_mp3(input_path: str, db: Union[int, float]) -> None:
         # Generate the output file name by appending the db value
         output_path = input_file.with_stem(f"{input_file.stem}_{db}dB")
 
-        # Construct the ffmpeg command
-        command = [
-            "ffmpeg",
-            "-i", str(input_file),
-            "-filter:a", f"volume={db}dB",
-            str(output_path)
-        ]
-
-        logger.info(f"Executing command: {' '.join(command)}")
-        
-        # Execute the ffmpeg command
-        subprocess.run(command, check=True)
+        steps = round(db / GAIN_STEP_DB)
+        if lossless and abs(steps * GAIN_STEP_DB - db) < 1e-6:
+            if in_place:
+                output_path = input_file
+            else:
+                shutil.copyfile(input_file, output_path)
+            frames, clamped = apply_gain_steps(output_path, steps)
+            if frames:
+                if clamped:
+                    logger.warning(f"{clamped} granule(s) clamped at the global_gain limit.")
+                logger.info(f"Adjusted {frames} frame(s) by {steps} step(s) losslessly. "
+                            f"Output: {output_path}")
+                return
+            # Not MPEG Layer III (e.g. Layer II or free format): nothing was changed.
+            logger.warning(f"No Layer III frames found in {input_file}; re-encoding with ffmpeg.")
+            if not in_place:
+                output_path.unlink()
+        elif lossless:
+            logger.info(f"{db} dB is not a multiple of {GAIN_STEP_DB} dB; re-encoding with ffmpeg.")
+        if in_place:
+            tmp_path = input_file.with_stem(f"{input_file.stem}.tmp")
+            _amplify_ffmpeg(input_file, tmp_path, db)
+            os.replace(tmp_path, input_file)
+            output_path = input_file
+        else:
+            _amplify_ffmpeg(input_file, output_path, db)
 
         logger.info(f"Amplification completed successfully. Output: {output_path}")
 
@@ -40,4 +224,3 @@ def amplify_mp3(input_path: str, db: Union[int, float]) -> None:
 
 if __name__ == "__main__":
     fire.Fire(amplify_mp3)
-
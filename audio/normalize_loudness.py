@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import fire
+from loguru import logger
+
+from amplify_mp3 import GAIN_STEP_DB, apply_gain_steps
+
+INDEX_NAME = ".loudness.json"
+
+_EBUR128_RE = {
+    "integrated": re.compile(r"I:\s+(-?[\d.]+|-inf)\s+LUFS"),
+    "lra": re.compile(r"LRA:\s+(-?[\d.]+)\s+LU"),
+    "peak": re.compile(r"Peak:\s+(-?[\d.]+|-inf)\s+dBFS"),
+}
+_VOLUMEDETECT_RE = {
+    "integrated": re.compile(r"mean_volume:\s+(-?[\d.]+|-inf)\s+dB"),
+    "peak": re.compile(r"max_volume:\s+(-?[\d.]+|-inf)\s+dB"),
+}
+
+
+def _gather_files(input_dir: Path, exts: List[str], recursive: bool) -> List[Path]:
+    pattern = "**/*" if recursive else "*"
+    return sorted(p for p in input_dir.glob(pattern)
+                  if p.is_file() and p.suffix.lower() in exts)
+
+
+def measure(path: Union[str, Path], method: str = "ebur128") -> Dict[str, float]:
+    """
+    Measure one file with ffmpeg.
+
+    :param path: Audio file.
+    :param method: "ebur128" (integrated LUFS, loudness range, true peak) or
+        "rms" (volumedetect mean/max volume; mean is reported as "integrated").
+    :return: Dict with "integrated" and "peak" (and "lra" for ebur128).
+    """
+    if method == "ebur128":
+        audio_filter, patterns = "ebur128=peak=true", _EBUR128_RE
+    else:
+        audio_filter, patterns = "volumedetect", _VOLUMEDETECT_RE
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-i", str(path),
+               "-map", "0:a:0", "-filter:a", audio_filter, "-f", "null", "-"]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    # ebur128 logs a running meter first; only the final summary matters.
+    text = result.stderr.rsplit("Summary:", 1)[-1]
+    values = {}
+    for key, pattern in patterns.items():
+        match = pattern.search(text)
+        if match is None:
+            raise ValueError(f"Could not parse {key} from ffmpeg output")
+        values[key] = float(match.group(1))
+    return values
+
+
+def _load_index(path: Path) -> Dict[str, dict]:
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable index {path}: {e}")
+        return {}
+
+
+def _save_index(path: Path, index: Dict[str, dict]) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _is_fresh(entry: Optional[dict], st: os.stat_result, method: str) -> bool:
+    return (entry is not None and method in entry
+            and entry.get("size") == st.st_size
+            and entry.get("mtime_ns") == st.st_mtime_ns)
+
+
+def _apply_one(src: Path, dst: Path, gain: float, max_gain: float, mp3_lossless: bool) -> str:
+    """Write src with gain dB applied to dst (never above max_gain dB); returns a log line."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if mp3_lossless and src.suffix.lower() == ".mp3":
+        steps = round(gain / GAIN_STEP_DB)
+        if steps * GAIN_STEP_DB > max_gain:
+            # Rounding up would push the peak past the limit.
+            steps = math.floor(max_gain / GAIN_STEP_DB)
+        shutil.copyfile(src, dst)
+        frames, clamped = apply_gain_steps(dst, steps)
+        if frames:
+            note = f", {clamped} granule(s) clamped" if clamped else ""
+            return f"{src} -> {dst}: {steps * GAIN_STEP_DB:+.1f} dB (lossless{note})"
+        # No Layer III frames (e.g. MPEG Layer II): re-encode below instead.
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-i", str(src), "-map_metadata", "0",
+               "-filter:a", f"volume={gain:.2f}dB", str(dst)]
+    subprocess.run(command, check=True)
+    return f"{src} -> {dst}: {gain:+.2f} dB"
+
+
+def normalize_loudness(
+    input_dir: str,
+    output_dir: Optional[str] = None,
+    target_lufs: float = -16.0,
+    method: str = "ebur128",
+    max_peak_db: float = -1.0,
+    exts: str = "mp3,wav,flac,m4a,aac,ogg,opus",
+    recursive: bool = True,
+    workers: Optional[int] = None,
+    index_path: Optional[str] = None,
+    mp3_lossless: bool = True,
+    overwrite: bool = False,
+) -> None:
+    """
+    Two-pass loudness normalization of every audio file under a directory.
+
+    Pass 1 measures each file with ffmpeg (in parallel) and caches the result in a
+    JSON index keyed by path and validated by size and mtime, one entry per method,
+    so re-runs only measure new or changed files. Pass 2 (when output_dir is given)
+    writes each file with the gain needed to reach target_lufs, mirroring the
+    directory tree.
+
+    :param input_dir: Directory containing audio files.
+    :param output_dir: Where normalized files are written. If omitted, only the
+        analysis pass runs.
+    :param target_lufs: Target integrated loudness (LUFS; dB mean volume for "rms").
+    :param method: "ebur128" (EBU R128 loudness + true peak) or "rms" (volumedetect).
+    :param max_peak_db: Gain is reduced so the measured peak stays at or below this.
+    :param exts: Comma-separated extensions to process.
+    :param recursive: Walk subdirectories.
+    :param workers: Concurrent ffmpeg processes for both passes (default: CPU count).
+    :param index_path: Measurement cache (default: <input_dir>/.loudness.json).
+    :param mp3_lossless: Apply MP3 gain losslessly via global_gain, rounded to 1.5 dB
+        steps (see amplify_mp3); other formats are re-encoded with ffmpeg.
+    :param overwrite: Re-write outputs that already exist.
+    """
+    if method not in ("ebur128", "rms"):
+        raise ValueError("method must be 'ebur128' or 'rms'.")
+    root = Path(input_dir).resolve()
+    ext_list = [e.strip().lower() for e in str(exts).split(",") if e.strip()]
+    ext_list = [e if e.startswith(".") else f".{e}" for e in ext_list]
+    files = _gather_files(root, ext_list, recursive)
+    if not files:
+        logger.warning("No audio files found.")
+        return
+    workers = workers or os.cpu_count() or 1
+
+    index_file = Path(index_path) if index_path else root / INDEX_NAME
+    index = _load_index(index_file)
+    stats = {str(p): p.stat() for p in files}
+    todo = [p for p in files if not _is_fresh(index.get(str(p)), stats[str(p)], method)]
+    logger.info(f"Found {len(files)} file(s); measuring {len(todo)}, "
+                f"{len(files) - len(todo)} cached.")
+
+    # ffmpeg does the work, so threads are enough to keep the pool busy.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(measure, p, method): p for p in todo}
+        try:
+            for fut in as_completed(futures):
+                p = futures[fut]
+                try:
+                    values = fut.result()
+                except Exception as e:
+                    logger.error(f"Failed to measure {p}: {e}")
+                    continue
+                st = stats[str(p)]
+                entry = index.get(str(p))
+                if not entry or (entry.get("size"), entry.get("mtime_ns")) != \
+                        (st.st_size, st.st_mtime_ns):
+                    entry = index[str(p)] = dict(size=st.st_size,
+                                                 mtime_ns=st.st_mtime_ns)
+                entry[method] = values
+                logger.info(f"{p}: {values['integrated']:.1f} "
+                            f"{'LUFS' if method == 'ebur128' else 'dB'}, "
+                            f"peak {values['peak']:.1f} dB")
+        finally:
+            # Keep finished measurements even if the run is interrupted.
+            _save_index(index_file, index)
+
+    if output_dir is None:
+        return
+
+    out_root = Path(output_dir).resolve()
+    jobs = []
+    for p in files:
+        entry = index.get(str(p), {}).get(method)
+        if entry is None or entry["integrated"] <= -70.0:
+            logger.warning(f"Skip (unmeasured or silent): {p}")
+            continue
+        dst = out_root / p.relative_to(root)
+        if dst.exists() and not overwrite:
+            logger.info(f"Skip (exists): {dst}")
+            continue
+        gain = target_lufs - entry["integrated"]
+        max_gain = max_peak_db - entry["peak"]
+        if gain > max_gain:
+            gain = max_gain
+            logger.warning(f"{p}: gain limited to {gain:+.2f} dB by peak "
+                           f"{entry['peak']:.1f} dB")
+        jobs.append((p, dst, gain, max_gain))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_apply_one, src, dst, gain, max_gain, mp3_lossless): src
+                   for src, dst, gain, max_gain in jobs}
+        for fut in as_completed(futures):
+            try:
+                logger.info(fut.result())
+            except Exception as e:
+                logger.error(f"Failed to normalize {futures[fut]}: {e}")
+
+    logger.info("Done.")
+
+
+if __name__ == "__main__":
+    fire.Fire(normalize_loudness)
@@ -1,21 +1,213 @@
 import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Tuple, Union
 import fire
 import pyheif
 from PIL import Image
 from loguru import logger
 
 
-def convert_images(input_dir: str, output_dir: str, output_format: str = "jpg"):
+PREVIEW_FORMATS = ["jpg", "jpeg", "webp"]
+
+
+def _iter_boxes(buf: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """Yield (type, box start, payload start, box end) for ISOBMFF boxes in buf[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", buf[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", buf[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos, pos + header, pos + size
+        pos += size
+
+
+def _thumbnail_as_primary(data: bytes) -> Optional[bytes]:
+    """
+    Return a copy of a HEIF file in which its embedded thumbnail item is the
+    primary image, or None if it has no thumbnail.
+
+    pyheif has no thumbnail API, but libheif decodes whichever item 'pitm'
+    names. The 'thmb' reference is renamed so libheif lists the thumbnail as
+    a top-level image instead of hiding it. Only the metadata is patched.
+    """
+    buf = bytearray(data)
+    meta = next((b for b in _iter_boxes(buf, 0, len(buf)) if b[0] == b"meta"), None)
+    if meta is None:
+        return None
+    pitm_at = pitm_width = thumb_id = None
+    # meta is a FullBox: skip its 4 version/flags bytes.
+    for box_type, _, payload, end in _iter_boxes(buf, meta[2] + 4, meta[3]):
+        width = 2 if buf[payload] == 0 else 4
+        fmt = ">H" if width == 2 else ">I"
+        if box_type == b"pitm":
+            pitm_at, pitm_width = payload + 4, width
+        elif box_type == b"iref":
+            for ref_type, ref_start, ref_payload, _ in _iter_boxes(buf, payload + 4, end):
+                if ref_type != b"thmb" or thumb_id is not None:
+                    continue
+                from_id = struct.unpack(fmt, buf[ref_payload:ref_payload + width])[0]
+                buf[ref_start + 4:ref_start + 8] = b"skip"
+                thumb_id = from_id
+    if pitm_at is None or thumb_id is None:
+        return None
+    buf[pitm_at:pitm_at + pitm_width] = thumb_id.to_bytes(pitm_width, "big")
+    return bytes(buf)
+
+
+def _load_heic(source: Union[str, bytes]) -> Image.Image:
+    """
+    Decode the primary image of a HEIC file (path or bytes) into a PIL image.
+
+    pyheif exposes the decoded plane as a buffer over libheif's memory, so
+    Image.frombuffer wraps it instead of copying it into a new bytes object
+    (RGBA is mapped outright; RGB is unpacked once into PIL's pixel layout).
+    """
+    heif_file = pyheif.read(source)
+    return Image.frombuffer(
+        heif_file.mode,
+        heif_file.size,
+        heif_file.data,
+        "raw",
+        heif_file.mode,
+        heif_file.stride,
+        1,
+    )
+
+
+def _load_preview(input_path: str, size: int) -> Image.Image:
+    """
+    Load an image no larger than size x size. The embedded thumbnail is used when
+    its longer side is at least size / 2; otherwise the full image is decoded and
+    downscaled (libheif cannot decode HEVC at reduced resolution).
+    """
+    with open(input_path, "rb") as f:
+        data = f.read()
+    image = None
+    try:
+        patched = _thumbnail_as_primary(data)
+        if patched is not None:
+            image = _load_heic(patched)
+    except Exception as e:
+        logger.debug(f"Embedded thumbnail unusable in {input_path}: {e}")
+    if image is None or max(image.size) * 2 < size:
+        image = _load_heic(data)
+    image.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+    return image
+
+
+def _convert_one(
+    input_path: str, output_path: str, output_format: str, preview_size: int = 0
+) -> Tuple[int, int]:
+    """
+    Convert one HEIC file.
+
+    :param preview_size: If non-zero, write a preview at most this many pixels on
+        its longer side (see _load_preview).
+    :return: (input bytes, output bytes).
+    """
+    if preview_size:
+        image = _load_preview(input_path, preview_size)
+    else:
+        image = _load_heic(input_path)
+
+    # Convert and save to a temp file first: a truncated output left by a killed
+    # run would otherwise look up to date and be skipped from then on.
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if output_format == "webp":
+            image.save(tmp_path, "WEBP", quality=85)
+        elif output_format in ["jpg", "jpeg"]:
+            # JPG does not support alpha channel
+            image = image.convert("RGB")
+            image.save(tmp_path, "JPEG", quality=95)
+        else:
+            image.save(tmp_path, "PNG")
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return os.path.getsize(input_path), os.path.getsize(output_path)
+
+
+def _is_up_to_date(input_path: str, output_path: str, preview_size: int = 0) -> bool:
+    """
+    True if output_path exists, is newer than input_path and was written in the
+    same mode: full conversions keep the source's longer side, previews are at
+    most preview_size and at least half of it (unless the source is smaller).
+    Only the image headers are read.
+    """
+    try:
+        if os.path.getmtime(output_path) < os.path.getmtime(input_path):
+            return False
+        with Image.open(output_path) as image:
+            longest = max(image.size)
+        full = max(pyheif.open(input_path).size)
+    except Exception:  # missing or unreadable: convert it again
+        return False
+    if preview_size:
+        return longest <= preview_size and (longest * 2 >= preview_size or longest == full)
+    return longest == full
+
+
+def _collect_jobs(
+    input_dir: str, output_dir: str, output_format: str, preview_size: int = 0
+) -> List[Tuple[str, str]]:
+    jobs, skipped = [], 0
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.lower().endswith(".heic"):
+            input_path = os.path.join(input_dir, filename)
+            output_filename = os.path.splitext(
+                filename)[0] + f".{output_format}"
+            output_path = os.path.join(output_dir, output_filename)
+            if _is_up_to_date(input_path, output_path, preview_size):
+                skipped += 1
+                continue
+            jobs.append((input_path, output_path))
+    if skipped:
+        logger.info(f"Skipped {skipped} file(s) with up-to-date output.")
+    return jobs
+
+
+def convert_images(
+    input_dir: str,
+    output_dir: str,
+    output_format: str = "jpg",
+    workers: int = 1,
+    preview: bool = False,
+    preview_size: int = 512,
+):
     """
     Convert all HEIC images in input_dir to PNG or JPG in output_dir.
 
+    Files whose output already exists, is newer than the source and has the size
+    this mode produces (full or preview) are skipped.
+
     :param input_dir: Directory containing HEIC images.
     :param output_dir: Directory to save converted images.
-    :param output_format: Output format, "png" or "jpg". Default is "jpg".
+    :param output_format: Output format, "png" or "jpg" ("jpg" or "webp" in preview
+        mode). Default is "jpg".
+    :param workers: Number of processes decoding/encoding in parallel. Default is 1.
+    :param preview: Write small previews instead, taken from the embedded thumbnail
+        when it is large enough, which skips decoding the full image.
+    :param preview_size: Maximum preview size in pixels (longer side). Default is 512.
     """
     output_format = output_format.lower()
-    if output_format not in ["png", "jpg", "jpeg"]:
+    if preview:
+        if output_format not in PREVIEW_FORMATS:
+            raise ValueError("Preview format must be 'jpg' or 'webp'.")
+    elif output_format not in ["png", "jpg", "jpeg"]:
         raise ValueError("Output format must be 'png' or 'jpg'.")
+    preview_size = preview_size if preview else 0
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
@@ -23,38 +215,39 @@ def convert_images(input_dir: str, output_dir: str, output_format: str = "jpg"):
     logger.info(
         f"Starting conversion: {input_dir} → {output_dir} (Format: {output_format})")
 
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(".heic"):
-            input_path = os.path.join(input_dir, filename)
-            output_filename = os.path.splitext(
-                filename)[0] + f".{output_format}"
-            output_path = os.path.join(output_dir, output_filename)
+    jobs = _collect_jobs(input_dir, output_dir, output_format, preview_size)
+    start = time.perf_counter()
+    done, total_in = 0, 0
 
-            try:
-                # Read the HEIC file
-                heif_file = pyheif.read(input_path)
-                image = Image.frombytes(
-                    heif_file.mode,
-                    heif_file.size,
-                    heif_file.data,
-                    "raw",
-                    heif_file.mode,
-                    heif_file.stride,
-                )
-
-                # Convert and save
-                if output_format in ["jpg", "jpeg"]:
-                    # JPG does not support alpha channel
-                    image = image.convert("RGB")
-                    image.save(output_path, "JPEG", quality=95)
-                else:
-                    image.save(output_path, "PNG")
-
-                logger.info(f"Converted: {input_path} to {output_path}")
+    def record(input_path: str, output_path: str, sizes: Tuple[int, int]) -> None:
+        nonlocal done, total_in
+        done += 1
+        total_in += sizes[0]
+        logger.info(f"Converted: {input_path} to {output_path}")
 
+    if workers <= 1:
+        for input_path, output_path in jobs:
+            try:
+                record(input_path, output_path,
+                       _convert_one(input_path, output_path, output_format, preview_size))
             except Exception as e:
                 logger.error(f"Failed to convert {input_path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_convert_one, i, o, output_format, preview_size): (i, o)
+                       for i, o in jobs}
+            for fut in as_completed(futures):
+                input_path, output_path = futures[fut]
+                try:
+                    record(input_path, output_path, fut.result())
+                except Exception as e:
+                    logger.error(f"Failed to convert {input_path}: {e}")
 
+    elapsed = time.perf_counter() - start
+    if done:
+        logger.info(
+            f"{done} image(s) in {elapsed:.1f}s: {done / elapsed:.2f} images/s, "
+            f"{total_in / elapsed / 1e6:.2f} MB/s")
     logger.success("Batch conversion completed!")
 
 
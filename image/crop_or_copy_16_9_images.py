@@ -1,13 +1,29 @@
 import os
-from PIL import Image
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+from PIL import Image, JpegImagePlugin
 import fire
 from loguru import logger
+from tqdm import tqdm
 
+# Linux FICLONE ioctl: share the source's extents (reflink) on btrfs/XFS.
+_FICLONE = 0x40049409
 
-def is_16_9_ratio(image: Image.Image) -> bool:
-    """Check if the image has a 16:9 aspect ratio."""
+
+def is_16_9_ratio(image: Image.Image, tolerance: float = 0.005) -> bool:
+    """Check if the image has a 16:9 aspect ratio, within a relative tolerance."""
     width, height = image.size
-    return width / height == 16 / 9
+    return abs(width / height / (16 / 9) - 1) <= tolerance
+
+
+def _crop_box_16_9(size: Tuple[int, int], row_align: int = 1) -> Tuple[int, int, int, int]:
+    """Centered 16:9 crop box keeping the full width; top is rounded down to row_align."""
+    width, height = size
+    target_height = int(width * 9 / 16)
+    top = (height - target_height) // 2 // row_align * row_align
+    return 0, top, width, top + target_height
 
 
 def center_crop_16_9(image: Image.Image) -> Image.Image:
@@ -15,31 +31,125 @@ def center_crop_16_9(image: Image.Image) -> Image.Image:
     width, height = image.size
     target_height = int(width * 9 / 16)
     if height > target_height:
-        top = (height - target_height) // 2
-        bottom = top + target_height
-        return image.crop((0, top, width, bottom))
+        return image.crop(_crop_box_16_9(image.size))
     return image
 
 
-def crop_or_copy_16_9_images(input_dir: str, output_dir: str = os.getcwd()):
-    """Process images in the input directory, copying or cropping to 16:9 ratio as needed."""
+def _copy_file(src: str, dst: str) -> None:
+    """Copy bytes, as a reflink where the filesystem supports it."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            import fcntl  # POSIX only; Windows falls through to a plain copy
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+def _jpeg_mcu_height(image: Image.Image) -> int:
+    """MCU height in pixels: 8 times the largest vertical sampling factor."""
+    return 8 * max((layer[2] for layer in getattr(image, "layer", [])), default=1)
+
+
+def _lossless_jpeg_crop(src: str, dst: str, box: Tuple[int, int, int, int]) -> bool:
+    """Crop a JPEG without re-encoding via jpegtran; False if jpegtran is unavailable."""
+    jpegtran = shutil.which("jpegtran")
+    if jpegtran is None:
+        return False
+    left, top, right, bottom = box
+    command = [jpegtran, "-copy", "all", "-optimize",
+               "-crop", f"{right - left}x{bottom - top}+{left}+{top}",
+               "-outfile", dst, src]
+    subprocess.run(command, check=True, capture_output=True)
+    return True
+
+
+def _process_one(filepath: str, output_path: str, tolerance: float) -> str:
+    """Copy or crop one image; returns "copied" or "cropped"."""
+    if os.path.exists(output_path) and os.path.samefile(filepath, output_path):
+        raise ValueError("output would overwrite the input")
+    # Image.open only parses the header; pixels are decoded on demand.
+    with Image.open(filepath) as img:
+        width, height = img.size
+        if is_16_9_ratio(img, tolerance) or height <= int(width * 9 / 16):
+            action = "copy"
+        elif img.format == "JPEG":
+            action = "jpeg"
+            box = _crop_box_16_9(img.size, _jpeg_mcu_height(img))
+        else:
+            img.crop(_crop_box_16_9(img.size)).save(output_path)
+            action = "crop"
+
+        if action == "jpeg" and not _lossless_jpeg_crop(filepath, output_path, box):
+            img.crop(box).save(output_path, "JPEG", qtables=img.quantization,
+                               subsampling=JpegImagePlugin.get_sampling(img),
+                               exif=img.info.get("exif", b""))
+
+    if action == "copy":
+        _copy_file(filepath, output_path)
+        return "copied"
+    return "cropped"
+
+
+def _collect_files(input_dir: str, recursive: bool, exclude: str) -> List[str]:
+    """Relative paths of the files under input_dir, skipping the exclude tree."""
+    if not recursive:
+        return sorted(f for f in os.listdir(input_dir)
+                      if os.path.isfile(os.path.join(input_dir, f)))
+    files = []
+    for root, dirs, names in os.walk(input_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude]
+        rel_root = os.path.relpath(root, input_dir)
+        files.extend(os.path.normpath(os.path.join(rel_root, n)) for n in names)
+    return sorted(files)
+
+
+def crop_or_copy_16_9_images(
+    input_dir: str,
+    output_dir: str = os.getcwd(),
+    tolerance: float = 0.005,
+    workers: Optional[int] = None,
+    recursive: bool = False,
+):
+    """
+    Process images in the input directory, copying or cropping to 16:9 ratio as needed.
+
+    Only the image header is read to decide. Images that are already 16:9 (within
+    tolerance) or too wide to crop are copied byte-for-byte. JPEGs are cropped
+    losslessly with jpegtran when it is installed, with the top edge aligned to the
+    MCU grid; otherwise the crop is re-encoded with the source's quantization tables.
+
+    :param input_dir: Directory containing images.
+    :param output_dir: Directory to save the results. Default is the current directory.
+    :param tolerance: Relative aspect-ratio tolerance for counting as 16:9.
+    :param workers: Threads processing files in parallel (Pillow releases the GIL
+        while decoding and encoding). Default is the CPU count.
+    :param recursive: Walk subdirectories and mirror their structure into output_dir.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    files = _collect_files(input_dir, recursive, os.path.abspath(output_dir))
+    counts = {"copied": 0, "cropped": 0, "failed": 0}
+
+    def run(rel_path: str) -> str:
+        output_path = os.path.join(output_dir, rel_path)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        return _process_one(os.path.join(input_dir, rel_path), output_path, tolerance)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run, f): f for f in files}
+        for fut in tqdm(as_completed(futures), total=len(futures), desc="Processing images"):
+            try:
+                action = fut.result()
+            except Exception as e:
+                # One unreadable file must not stop the batch.
+                counts["failed"] += 1
+                logger.error(f"Failed: {futures[fut]}: {e}")
+                continue
+            counts[action] += 1
 
-    for filename in os.listdir(input_dir):
-        filepath = os.path.join(input_dir, filename)
-        if not os.path.isfile(filepath):
-            continue
-
-        with Image.open(filepath) as img:
-            if is_16_9_ratio(img):
-                output_path = os.path.join(output_dir, filename)
-                img.save(output_path)
-                logger.info(f"Copied: {filename}")
-            else:
-                cropped_img = center_crop_16_9(img)
-                output_path = os.path.join(output_dir, filename)
-                cropped_img.save(output_path)
-                logger.success(f"Cropped and saved: {filename}")
+    logger.success(f"Copied {counts['copied']}, cropped {counts['cropped']}, "
+                   f"failed {counts['failed']}.")
 
 
 if __name__ == '__main__':
@@ -1,44 +1,69 @@
-from typing import Optional
-from PIL import Image
+import csv
+import glob
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image, ImageColor
 import fire
 from loguru import logger
 import os
 
+from streaming_image_writer import PngRowWriter, TiledTiffWriter
 
-def concatenate_images_horizontally(
-    left_image_path: str,
-    right_image_path: str,
-    output_path: Optional[str] = None
-) -> None:
-    try:
-        left_image = Image.open(left_image_path)
-        right_image = Image.open(right_image_path)
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
 
-        # Check if image heights are equal
-        if left_image.height != right_image.height:
-            logger.error("Images must have the same height to concatenate.")
-            return
+# (x, y, width, height) of one tile on the mosaic canvas.
+Rect = Tuple[int, int, int, int]
 
-        # If output_path is not provided, construct default name
-        if not output_path:
-            left_name, _ = os.path.splitext(os.path.basename(left_image_path))
-            right_name, extension = os.path.splitext(
-                os.path.basename(right_image_path))
-            output_path = f"{left_name}_{right_name}_concatenated{extension}"
 
-        # Compute the total width and ensure same height
-        total_width = left_image.width + right_image.width
-        height = left_image.height
+def _default_output_name(left_image_path: str, right_image_path: str) -> str:
+    left_name, _ = os.path.splitext(os.path.basename(left_image_path))
+    right_name, extension = os.path.splitext(
+        os.path.basename(right_image_path))
+    return f"{left_name}_{right_name}_concatenated{extension}"
+
+
+def _concatenate_pair(left_image_path: str, right_image_path: str, output_path: str) -> str:
+    """Concatenate one pair, scaling the taller image down to the shorter one's height."""
+    with Image.open(left_image_path) as left_image, Image.open(right_image_path) as right_image:
+        height = min(left_image.height, right_image.height)
+        images = []
+        for image in (left_image, right_image):
+            if image.height != height:
+                width = max(1, round(image.width * height / image.height))
+                image.draft("RGB", (width, height))  # cheap JPEG DCT downscale
+                image = image.resize((width, height), Image.LANCZOS)
+            images.append(image)
 
         # Create new image with the final size
-        new_image = Image.new('RGB', (total_width, height))
+        new_image = Image.new('RGB', (images[0].width + images[1].width, height))
 
         # Paste images side by side
-        new_image.paste(left_image, (0, 0))
-        new_image.paste(right_image, (left_image.width, 0))
+        new_image.paste(images[0], (0, 0))
+        new_image.paste(images[1], (images[0].width, 0))
 
         # Save the concatenated image
         new_image.save(output_path)
+    return output_path
+
+
+def concatenate_images_horizontally(
+    left_image_path: str,
+    right_image_path: str,
+    output_path: Optional[str] = None
+) -> None:
+    """
+    Concatenate two images side by side. If their heights differ, the taller one is
+    scaled down to match.
+    """
+    try:
+        # If output_path is not provided, construct default name
+        if not output_path:
+            output_path = _default_output_name(left_image_path, right_image_path)
+
+        _concatenate_pair(left_image_path, right_image_path, output_path)
         logger.info(
             f"The images have been concatenated and saved to {output_path}")
 
@@ -46,6 +71,244 @@ def concatenate_images_horizontally(
         logger.error(f"An error occurred: {e}")
 
 
+def _pairs_from_dirs(left_dir: str, right_dir: str) -> List[Tuple[str, str]]:
+    """Pair images in two directories by file stem."""
+    def by_stem(directory: str) -> Dict[str, str]:
+        return {os.path.splitext(f)[0]: os.path.join(directory, f)
+                for f in sorted(os.listdir(directory)) if f.lower().endswith(IMAGE_EXTS)}
+
+    left, right = by_stem(left_dir), by_stem(right_dir)
+    unmatched = set(left) ^ set(right)
+    if unmatched:
+        logger.warning(f"{len(unmatched)} file(s) have no partner, e.g. {sorted(unmatched)[:5]}")
+    return [(left[stem], right[stem]) for stem in sorted(set(left) & set(right))]
+
+
+def _pairs_from_csv(pairs_csv: str) -> List[Tuple[str, str]]:
+    """Read left,right path pairs from a CSV; relative paths are taken from the CSV's folder."""
+    base = os.path.dirname(os.path.abspath(pairs_csv))
+    pairs = []
+    with open(pairs_csv, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].startswith("#"):
+                continue
+            if not pairs and row[0].strip().lower() == "left":
+                continue  # header
+            pairs.append(tuple(os.path.join(base, p.strip()) for p in row[:2]))
+    return pairs
+
+
+def batch_concatenate(
+    output_dir: str,
+    left_dir: Optional[str] = None,
+    right_dir: Optional[str] = None,
+    pairs_csv: Optional[str] = None,
+    workers: Optional[int] = None,
+    overwrite: bool = False,
+) -> None:
+    """
+    Concatenate many before/after pairs in one process.
+
+    :param output_dir: Directory for the concatenated images.
+    :param left_dir: Directory of left images, paired with right_dir by file stem.
+    :param right_dir: Directory of right images.
+    :param pairs_csv: CSV of "left,right" path rows instead of two directories.
+    :param workers: Threads concatenating in parallel (Pillow releases the GIL while
+        decoding, resizing and encoding). Default is the CPU count.
+    :param overwrite: Re-create outputs that already exist.
+    """
+    if pairs_csv:
+        pairs = _pairs_from_csv(pairs_csv)
+    elif left_dir and right_dir:
+        pairs = _pairs_from_dirs(left_dir, right_dir)
+    else:
+        raise ValueError("Give either left_dir and right_dir, or pairs_csv.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for left, right in pairs:
+        output_path = os.path.join(output_dir, _default_output_name(left, right))
+        if overwrite or not os.path.exists(output_path):
+            jobs.append((left, right, output_path))
+    logger.info(f"{len(pairs)} pair(s), {len(jobs)} to concatenate.")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(_concatenate_pair, *job): job for job in jobs}
+        for fut in as_completed(futures):
+            left, right, _ = futures[fut]
+            try:
+                logger.info(f"Saved {fut.result()}")
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to concatenate {left} + {right}: {e}")
+
+    logger.info(f"Done: {len(jobs) - failed} concatenated, {failed} failed.")
+
+
+def _expand_inputs(inputs: Union[str, Sequence[str]]) -> List[str]:
+    """A directory, a glob, or a comma-separated / Fire-parsed list of paths."""
+    if isinstance(inputs, str):
+        if os.path.isdir(inputs):
+            return sorted(os.path.join(inputs, f) for f in os.listdir(inputs)
+                          if f.lower().endswith(IMAGE_EXTS))
+        if any(c in inputs for c in "*?["):
+            return sorted(glob.glob(inputs))
+        inputs = [p.strip() for p in inputs.split(",") if p.strip()]
+    return list(inputs)
+
+
+def _layout(sizes: List[Tuple[int, int]], cols: int, tile_height: Optional[int]) -> Tuple[List[Rect], int, int]:
+    """
+    Place tiles row by row, left to right. With tile_height every tile is scaled to
+    that height; otherwise each row is as tall as its tallest tile and shorter tiles
+    are top-aligned. Returns (rects, canvas width, canvas height).
+    """
+    rects, y, canvas_width = [], 0, 0
+    for start in range(0, len(sizes), cols):
+        row = sizes[start:start + cols]
+        if tile_height:
+            row = [(max(1, round(w * tile_height / h)), tile_height) for w, h in row]
+        x = 0
+        for w, h in row:
+            rects.append((x, y, w, h))
+            x += w
+        canvas_width = max(canvas_width, x)
+        y += max(h for _, h in row)
+    return rects, canvas_width, y
+
+
+def _load_tile(path: str, size: Tuple[int, int]) -> np.ndarray:
+    """Decode an image as RGB at exactly size; JPEGs are decoded at reduced scale when possible."""
+    with Image.open(path) as img:
+        if img.size != size:
+            img.draft("RGB", size)  # libjpeg DCT scaling; no-op for other formats
+        img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, Image.LANCZOS)
+        return np.asarray(img)
+
+
+def _paste(band: np.ndarray, band_x: int, band_y: int, rect: Rect, pixels: np.ndarray) -> None:
+    """Copy the part of a tile that overlaps band (whose top-left is at band_x, band_y)."""
+    x, y, w, h = rect
+    bh, bw = band.shape[:2]
+    x0, x1 = max(x, band_x), min(x + w, band_x + bw)
+    y0, y1 = max(y, band_y), min(y + h, band_y + bh)
+    if x0 < x1 and y0 < y1:
+        band[y0 - band_y:y1 - band_y, x0 - band_x:x1 - band_x] = \
+            pixels[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+def _write_tiff(paths, rects, width, height, output_path, background, tile) -> None:
+    """
+    Emit TIFF tile rows band by band. Within a band, tile columns go left to right
+    and a source is decoded when the first column needs it and dropped once the
+    columns pass it, so memory holds one column of tiles plus the sources crossing it.
+    """
+    next_ty = 0
+    with TiledTiffWriter(output_path, width, height, tile) as writer:
+        row_ends = sorted({y + h for _, y, _, h in rects})
+        for row_end in row_ends:
+            ty_end = -(-row_end // tile) if row_end < height else writer.tiles_down
+            if ty_end <= next_ty:
+                continue
+            band_y, band_h = next_ty * tile, (ty_end - next_ty) * tile
+            needed = sorted((i for i, (x, y, w, h) in enumerate(rects)
+                             if y < band_y + band_h and y + h > band_y),
+                            key=lambda i: rects[i][0])
+            decoded: Dict[int, np.ndarray] = {}
+            for tx in range(writer.tiles_across):
+                col_x = tx * tile
+                for i in list(decoded):
+                    if rects[i][0] + rects[i][2] <= col_x:
+                        del decoded[i]
+                strip = np.empty((band_h, tile, 3), dtype=np.uint8)
+                strip[:] = background
+                for i in needed:
+                    x, _, w, _ = rects[i]
+                    if x < col_x + tile and x + w > col_x:
+                        if i not in decoded:
+                            decoded[i] = _load_tile(paths[i], rects[i][2:])
+                        _paste(strip, col_x, band_y, rects[i], decoded[i])
+                for k in range(ty_end - next_ty):
+                    writer.write_tile(tx, next_ty + k, strip[k * tile:(k + 1) * tile])
+            next_ty = ty_end
+
+
+def _write_png(paths, rects, width, height, output_path, background) -> None:
+    """Emit one mosaic row at a time; sources are decoded and pasted one by one."""
+    with PngRowWriter(output_path, width, height) as writer:
+        y = 0
+        while y < height:
+            members = [i for i, r in enumerate(rects) if r[1] == y]
+            band_h = max(rects[i][3] for i in members)
+            band = np.empty((band_h, width, 3), dtype=np.uint8)
+            band[:] = background
+            for i in members:
+                _paste(band, 0, y, rects[i], _load_tile(paths[i], rects[i][2:]))
+            writer.write_rows(band)
+            y += band_h
+
+
+def build_mosaic(
+    inputs: Union[str, Sequence[str]],
+    output_path: str,
+    cols: Optional[int] = None,
+    rows: Optional[int] = None,
+    tile_height: Optional[int] = None,
+    background: str = "black",
+    tiff_tile: int = 256,
+) -> None:
+    """
+    Stitch many images into a grid or panorama that may be larger than RAM.
+
+    The canvas is never allocated: output is streamed in horizontal bands through a
+    tiled TIFF (.tif/.tiff; memory is about one tile column of a band) or a PNG
+    written row by row (.png; memory is about one mosaic row, so prefer TIFF for
+    very wide panoramas).
+
+    :param inputs: Directory, glob pattern, or list of image paths, in mosaic order.
+    :param output_path: Output .tif/.tiff or .png path.
+    :param cols: Tiles per row. Default: all in one row (panorama), or derived from rows.
+    :param rows: Number of rows, used when cols is not given.
+    :param tile_height: Resize every tile to this height (aspect ratio kept).
+    :param background: Fill color for uncovered areas.
+    :param tiff_tile: TIFF tile size in pixels (multiple of 16).
+    """
+    paths = _expand_inputs(inputs)
+    if not paths:
+        logger.error("No input images found.")
+        return
+    if cols is None:
+        cols = math.ceil(len(paths) / rows) if rows else len(paths)
+
+    sizes = []
+    for path in paths:
+        with Image.open(path) as img:  # header only
+            sizes.append(img.size)
+    rects, width, height = _layout(sizes, cols, tile_height)
+    fill = ImageColor.getrgb(background)[:3]
+    logger.info(f"Mosaic of {len(paths)} image(s): {width}x{height} px, {cols} per row.")
+
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext in (".tif", ".tiff"):
+        _write_tiff(paths, rects, width, height, output_path, fill, tiff_tile)
+    elif ext == ".png":
+        _write_png(paths, rects, width, height, output_path, fill)
+    else:
+        raise ValueError("Mosaic output must be .tif, .tiff or .png.")
+    logger.info(f"Mosaic saved to {output_path}")
+
+
+# Sub-commands selected by the first CLI argument; anything else is the
+# original two-image form, so existing invocations keep working.
+COMMANDS = {"mosaic": build_mosaic, "batch": batch_concatenate}
+
+
 if __name__ == "__main__":
     # Fire's entry point for CLI
-    fire.Fire(concatenate_images_horizontally)
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        fire.Fire(COMMANDS[sys.argv[1]], command=sys.argv[2:])
+    else:
+        fire.Fire(concatenate_images_horizontally)
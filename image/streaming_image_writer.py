@@ -0,0 +1,167 @@
+import struct
+import zlib
+from typing import List
+
+import numpy as np
+
+# TIFF field types.
+_SHORT, _LONG, _LONG8 = 3, 4, 16
+
+
+class TiledTiffWriter:
+    """
+    Write an 8-bit RGB tiled TIFF one tile at a time, in any order.
+
+    Tiles are deflate-compressed and appended as they arrive; the IFD with
+    the tile offset table is written on close(), so only the tile being
+    written is ever held in memory. BigTIFF is used when a classic TIFF's
+    32-bit offsets might overflow.
+    """
+
+    def __init__(self, path: str, width: int, height: int, tile: int = 256, level: int = 6):
+        if tile % 16:
+            raise ValueError("TIFF tile size must be a multiple of 16.")
+        self.width, self.height, self.tile, self.level = width, height, tile, level
+        self.tiles_across = -(-width // tile)
+        self.tiles_down = -(-height // tile)
+        n = self.tiles_across * self.tiles_down
+        self.offsets: List[int] = [0] * n
+        self.counts: List[int] = [0] * n
+        # Worst-case deflate output is slightly larger than the input.
+        self.big = n * tile * tile * 3 * 1.01 + (1 << 20) >= 1 << 32
+        self._f = open(path, "wb")
+        if self.big:
+            self._f.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+        else:
+            self._f.write(b"II" + struct.pack("<HI", 42, 0))
+
+    def write_tile(self, tx: int, ty: int, pixels: np.ndarray) -> None:
+        """Write the tile at column tx, row ty; pixels is (tile, tile, 3) uint8."""
+        data = zlib.compress(np.ascontiguousarray(pixels, dtype=np.uint8).tobytes(), self.level)
+        index = ty * self.tiles_across + tx
+        self.offsets[index] = self._f.tell()
+        self.counts[index] = len(data)
+        self._f.write(data)
+
+    def _write_array(self, fmt: str, values: List[int]) -> int:
+        if self._f.tell() % 2:
+            self._f.write(b"\0")  # TIFF offsets must be word-aligned
+        offset = self._f.tell()
+        self._f.write(struct.pack(f"<{len(values)}{fmt}", *values))
+        return offset
+
+    def close(self) -> None:
+        if any(c == 0 for c in self.counts):
+            self._f.close()
+            raise ValueError("Not every tile was written.")
+        off_type, off_fmt = (_LONG8, "Q") if self.big else (_LONG, "I")
+        if len(self.offsets) == 1:
+            # A single value fits in the IFD entry itself and must be stored inline.
+            offsets_at, counts_at = self.offsets[0], self.counts[0]
+        else:
+            offsets_at = self._write_array(off_fmt, self.offsets)
+            counts_at = self._write_array(off_fmt, self.counts)
+        bits_at = 0 if self.big else self._write_array("H", [8, 8, 8])
+        entries = [
+            (256, _LONG, 1, self.width),
+            (257, _LONG, 1, self.height),
+            (258, _SHORT, 3, bits_at),
+            (259, _SHORT, 1, 8),    # Adobe deflate
+            (262, _SHORT, 1, 2),    # RGB
+            (277, _SHORT, 1, 3),
+            (284, _SHORT, 1, 1),    # chunky
+            (322, _LONG, 1, self.tile),
+            (323, _LONG, 1, self.tile),
+            (324, off_type, len(self.offsets), offsets_at),
+            (325, off_type, len(self.counts), counts_at),
+        ]
+        if self._f.tell() % 2:
+            self._f.write(b"\0")
+        ifd_at = self._f.tell()
+        if self.big:
+            self._f.write(struct.pack("<Q", len(entries)))
+            for tag, typ, count, value in entries:
+                # Values sit left-justified in the value field; BigTIFF's 8-byte
+                # field holds BitsPerSample inline instead of by offset.
+                if tag == 258:
+                    packed = struct.pack("<3H", 8, 8, 8)
+                elif typ == _SHORT:
+                    packed = struct.pack("<H", value)
+                else:
+                    packed = struct.pack("<Q", value)
+                self._f.write(struct.pack("<HHQ", tag, typ, count) + packed.ljust(8, b"\0"))
+            self._f.write(struct.pack("<Q", 0))
+            self._f.seek(8)
+            self._f.write(struct.pack("<Q", ifd_at))
+        else:
+            self._f.write(struct.pack("<H", len(entries)))
+            for tag, typ, count, value in entries:
+                packed = struct.pack("<H", value) if typ == _SHORT and count == 1 else \
+                    struct.pack("<I", value)
+                self._f.write(struct.pack("<HHI", tag, typ, count) + packed.ljust(4, b"\0"))
+            self._f.write(struct.pack("<I", 0))
+            self._f.seek(4)
+            self._f.write(struct.pack("<I", ifd_at))
+        self._f.close()
+
+    def __enter__(self) -> "TiledTiffWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+
+class PngRowWriter:
+    """
+    Write an 8-bit RGB PNG from successive bands of rows.
+
+    Rows are deflated through one streaming compressor and flushed as IDAT
+    chunks, so only the current band is held in memory.
+    """
+
+    def __init__(self, path: str, width: int, height: int, level: int = 6, chunk_size: int = 1 << 20):
+        self.width, self.height, self.chunk_size = width, height, chunk_size
+        self.rows_written = 0
+        self._z = zlib.compressobj(level)
+        self._pending = bytearray()
+        self._f = open(path, "wb")
+        self._f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._f.write(struct.pack(">I", len(data)) + kind + data)
+        self._f.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write_rows(self, pixels: np.ndarray) -> None:
+        """Append rows; pixels is (n, width, 3) uint8."""
+        n = len(pixels)
+        # Each scanline is prefixed with filter type 0 (none).
+        raw = np.zeros((n, 1 + self.width * 3), dtype=np.uint8)
+        raw[:, 1:] = np.asarray(pixels, dtype=np.uint8).reshape(n, -1)
+        self._pending += self._z.compress(raw.tobytes())
+        self.rows_written += n
+        while len(self._pending) >= self.chunk_size:
+            self._chunk(b"IDAT", bytes(self._pending[:self.chunk_size]))
+            del self._pending[:self.chunk_size]
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            self._f.close()
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows.")
+        self._pending += self._z.flush()
+        if self._pending:
+            self._chunk(b"IDAT", bytes(self._pending))
+        self._chunk(b"IEND", b"")
+        self._f.close()
+
+    def __enter__(self) -> "PngRowWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from streaming_image_writer import PngRowWriter, TiledTiffWriter
+
+
+@pytest.mark.parametrize("width, height, tile", [(220, 130, 256), (300, 200, 128)])
+def test_tiled_tiff_roundtrip(tmp_path, width, height, tile):
+    """Single-tile images store TileOffsets/TileByteCounts inline; both layouts must read back."""
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    path = tmp_path / "out.tif"
+    with TiledTiffWriter(str(path), width, height, tile=tile) as writer:
+        for ty in range(writer.tiles_down):
+            for tx in range(writer.tiles_across):
+                block = np.zeros((tile, tile, 3), dtype=np.uint8)
+                part = pixels[ty * tile:(ty + 1) * tile, tx * tile:(tx + 1) * tile]
+                block[:part.shape[0], :part.shape[1]] = part
+                writer.write_tile(tx, ty, block)
+    with Image.open(path) as image:
+        assert np.array_equal(np.asarray(image.convert("RGB")), pixels)
+
+
+def test_png_rows_roundtrip(tmp_path):
+    pixels = np.arange(40 * 30 * 3, dtype=np.uint8).reshape(30, 40, 3)
+    path = tmp_path / "out.png"
+    with PngRowWriter(str(path), 40, 30, chunk_size=64) as writer:
+        writer.write_rows(pixels[:10])
+        writer.write_rows(pixels[10:])
+    with Image.open(path) as image:
+        assert np.array_equal(np.asarray(image), pixels)
@@ -0,0 +1,122 @@
+import collections
+import gzip
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Deque, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip works without it
+    zstandard = None
+
+CODECS = ("gzip", "zstd")
+EXTENSIONS = {"gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+
+def check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {CODECS}.")
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("codec='zstd' needs the 'zstandard' package.")
+
+
+class BlockCompressor:
+    """
+    File-like sink that compresses its input in independent blocks on a
+    thread pool, pigz-style.
+
+    Each block becomes a complete gzip member or zstd frame; concatenated,
+    they form a valid .gz / .zst stream that stock gzip, zstd and tar read
+    as one. zlib and zstd release the GIL while compressing, so threads
+    scale. At most 2 * threads blocks are in flight, bounding memory.
+
+    flush_block() ends the current block early, so the next write starts a
+    new member; block_offsets[i] is the compressed offset of block i once it
+    has been written.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        codec: str = "gzip",
+        level: int = 6,
+        threads: Optional[int] = None,
+        block_size: int = 4 << 20,
+    ):
+        check_codec(codec)
+        self.fileobj = fileobj
+        self.codec = codec
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads or os.cpu_count() or 1
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.block_offsets: List[int] = []
+        self._buf = bytearray()
+        self._pending: Deque[Future] = collections.deque()
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=self.threads)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "gzip":
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+        # ZstdCompressor objects must not be shared between threads.
+        cctx = getattr(self._local, "cctx", None)
+        if cctx is None:
+            cctx = self._local.cctx = zstandard.ZstdCompressor(
+                level=self.level, write_content_size=True)
+        return cctx.compress(data)
+
+    def _write_oldest(self) -> None:
+        data = self._pending.popleft().result()
+        self.block_offsets.append(self.bytes_out)
+        self.fileobj.write(data)
+        self.bytes_out += len(data)
+
+    def _submit(self, data: bytes) -> None:
+        while len(self._pending) >= 2 * self.threads:
+            self._write_oldest()
+        self._pending.append(self._pool.submit(self._compress, data))
+
+    def write(self, data) -> int:
+        self._buf += data
+        self.bytes_in += len(data)
+        while len(self._buf) >= self.block_size:
+            self._submit(bytes(self._buf[:self.block_size]))
+            del self._buf[:self.block_size]
+        return len(data)
+
+    def tell(self) -> int:
+        """Uncompressed position (tarfile calls this in "w" mode)."""
+        return self.bytes_in
+
+    def flush_block(self) -> int:
+        """End the current block; returns the index the next block will get."""
+        if self._buf:
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        return len(self.block_offsets) + len(self._pending)
+
+    def close(self) -> None:
+        """Write out every block; the underlying file is left open."""
+        self.flush_block()
+        while self._pending:
+            self._write_oldest()
+        self._pool.shutdown()
+
+
+def open_reader(fileobj: BinaryIO, codec: str) -> BinaryIO:
+    """
+    Decompressing reader over concatenated gzip members or zstd frames,
+    starting at fileobj's current position.
+    """
+    check_codec(codec)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+
+
+def codec_for(path: str) -> str:
+    """Guess the codec from an archive file name."""
+    return "zstd" if path.endswith((".zst", ".zstd")) else "gzip"
@@ -1,17 +1,185 @@
+import hashlib
+import io
+import json
 import os
+import shutil
 import subprocess
-from typing import Optional
+import sys
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 from loguru import logger
 import fire
 
+from block_compressor import EXTENSIONS, BlockCompressor, check_codec, codec_for, open_reader
 
-def compress_directory(directory_path: str, output_filename: Optional[str] = None) -> None:
+MANIFEST_SUFFIX = ".manifest.json"
+INDEX_SUFFIX = ".index.json"
+# Archive member listing paths deleted since the previous archive (incremental mode).
+DELETED_MEMBER = ".deleted.json"
+
+
+def _walk(directory_path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (path, arcname) for the directory and everything under it, in sorted order."""
+    parent = os.path.dirname(directory_path)
+    for root, dirs, files in os.walk(directory_path):
+        dirs.sort()
+        yield root, os.path.relpath(root, parent)
+        # os.walk lists symlinks to directories under dirs but doesn't descend them.
+        links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+        for name in sorted(files + links):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, parent)
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _scan(directory_path: str, exclude: str) -> Dict[str, dict]:
+    """Manifest entries (type, size, mtime_ns, path) keyed by arcname."""
+    entries = {}
+    for path, arcname in _walk(directory_path):
+        if os.path.abspath(path) == exclude:
+            continue  # don't archive the archive being written
+        st = os.lstat(path)
+        kind = "l" if os.path.islink(path) else "d" if os.path.isdir(path) else "f"
+        entries[arcname] = {"type": kind, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                            "path": path}
+    return entries
+
+
+def _manifest_path(archive: str) -> str:
+    return archive if archive.endswith(MANIFEST_SUFFIX) else archive + MANIFEST_SUFFIX
+
+
+def _diff_manifest(
+    current: Dict[str, dict], previous: Dict[str, dict], hash_files: bool
+) -> Tuple[List[str], List[str]]:
+    """
+    Return (changed arcnames, deleted arcnames). Only files whose size or mtime
+    changed are hashed, so the cost follows the churn rather than the tree size.
+    """
+    changed = []
+    for name, entry in current.items():
+        old = previous.get(name)
+        if old is None or old["type"] != entry["type"]:
+            changed.append(name)
+        elif entry["type"] == "f":
+            if (old["size"], old["mtime_ns"]) == (entry["size"], entry["mtime_ns"]):
+                if "sha256" in old:
+                    entry["sha256"] = old["sha256"]
+                continue
+            if hash_files and old["size"] == entry["size"] and "sha256" in old:
+                entry["sha256"] = _hash_file(entry["path"])
+                if entry["sha256"] == old["sha256"]:
+                    continue  # touched but not modified
+            changed.append(name)
+        elif entry["type"] == "l" and os.readlink(entry["path"]) != old.get("target"):
+            changed.append(name)
+    deleted = sorted(set(previous) - set(current))
+    return changed, deleted
+
+
+def _save_manifest(path: str, entries: Dict[str, dict], base: Optional[str], hash_files: bool) -> None:
+    files = {}
+    for name, entry in entries.items():
+        record = {k: v for k, v in entry.items() if k != "path"}
+        if entry["type"] == "l":
+            record["target"] = os.readlink(entry["path"])
+        elif entry["type"] == "f" and hash_files and "sha256" not in record:
+            record["sha256"] = _hash_file(entry["path"])
+        files[name] = record
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"base": base, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _compress_python(
+    members: List[Tuple[str, str]],
+    output_filename: str,
+    codec: str,
+    level: int,
+    threads: Optional[int],
+    block_size_mb: float,
+    deleted: Optional[List[str]] = None,
+    seekable: bool = False,
+) -> None:
+    """
+    Stream a tar of (path, arcname) members through BlockCompressor.
+
+    In seekable mode every member starts a new block and <output>.index.json maps
+    each arcname to the compressed offset of that block, for extract().
+    """
+    starts: Dict[str, int] = {}
+    start = time.perf_counter()
+    with open(output_filename, "wb") as f:
+        sink = BlockCompressor(f, codec=codec, level=level, threads=threads,
+                               block_size=int(block_size_mb * (1 << 20)))
+        # Plain "w" (not "w|") writes straight through, without re-buffering.
+        with tarfile.open(fileobj=sink, mode="w") as tar:
+            for path, arcname in members:
+                if seekable:
+                    starts[arcname] = sink.flush_block()
+                tar.add(path, arcname=arcname, recursive=False)
+            if deleted:
+                data = json.dumps(deleted, ensure_ascii=False).encode("utf-8")
+                info = tarfile.TarInfo(DELETED_MEMBER)
+                info.size, info.mtime = len(data), int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+        sink.close()
+    if seekable:
+        index = {name: sink.block_offsets[block] for name, block in starts.items()}
+        tmp = f"{output_filename}{INDEX_SUFFIX}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"codec": codec, "members": index}, f, indent=1)
+        os.replace(tmp, output_filename + INDEX_SUFFIX)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"{sink.bytes_in / 1e6:.1f} MB -> {sink.bytes_out / 1e6:.1f} MB in {elapsed:.1f}s "
+        f"({sink.bytes_in / 1e6 / elapsed:.1f} MB/s, {sink.threads} threads)")
+
+
+def compress_directory(
+    directory_path: str,
+    output_filename: Optional[str] = None,
+    engine: str = "python",
+    codec: str = "gzip",
+    level: int = 6,
+    threads: Optional[int] = None,
+    block_size_mb: float = 4,
+    incremental_from: Optional[str] = None,
+    hash_files: bool = False,
+    seekable: bool = False,
+) -> None:
     """
     Compresses the specified directory into a .tar.gz file.
     The output filename defaults to {directory_name}.tar.gz if not provided.
 
     :param directory_path: Path to the directory to compress.
     :param output_filename: Optional; The name of the output .tar.gz file.
+    :param engine: "python" compresses in-process on a thread pool (pigz-style gzip
+        members or zstd frames, readable by stock tar); "tar" runs `tar -czf`.
+    :param codec: "gzip" or "zstd" (python engine; zstd needs the zstandard package
+        and defaults the output to .tar.zst).
+    :param level: Compression level (gzip 1-9, zstd 1-22).
+    :param threads: Compression threads for the python engine. Default: CPU count.
+    :param block_size_mb: Uncompressed size of each independently compressed block.
+        Larger blocks compress slightly better; smaller ones spread across threads sooner.
+    :param incremental_from: Previous archive (or its .manifest.json). Only new or
+        changed entries are archived, plus a .deleted.json list of removed paths; see
+        restore(). The python engine always writes <output>.manifest.json for the next run.
+    :param hash_files: Record SHA-256 in the manifest, so files whose mtime changed
+        but whose content did not are left out of the next delta.
+    :param seekable: Start every member in its own gzip member / zstd frame and write
+        <output>.index.json, so extract() can seek straight to single files. Archives
+        of many small files compress somewhat worse.
     """
 
     # Normalize and clean up the directory path
@@ -21,11 +189,18 @@ def compress_directory(directory_path: str, output_filename: Optional[str] = Non
     if not os.path.isdir(directory_path):
         logger.error(f"Directory '{directory_path}' does not exist.")
         return
+    if engine not in ("python", "tar"):
+        raise ValueError("engine must be 'python' or 'tar'.")
+    if engine == "python":
+        check_codec(codec)
+    elif incremental_from or seekable:
+        raise ValueError("incremental_from and seekable need engine='python'.")
 
     # Generate the default output filename if none is provided
     if not output_filename:
         directory_name = os.path.basename(directory_path)
-        output_filename = f"{directory_name}.tar.gz"
+        extension = EXTENSIONS[codec] if engine == "python" else ".tar.gz"
+        output_filename = f"{directory_name}{extension}"
 
     # Check if the output file already exists
     if os.path.exists(output_filename):
@@ -37,9 +212,28 @@ def compress_directory(directory_path: str, output_filename: Optional[str] = Non
         else:
             logger.info(f"Overwriting existing file '{output_filename}'.")
 
+    if engine == "python":
+        logger.info(
+            f"Compressing directory '{directory_path}' to '{output_filename}'.")
+        entries = _scan(directory_path, os.path.abspath(output_filename))
+        names, deleted = list(entries), []
+        if incremental_from:
+            with open(_manifest_path(incremental_from), "r", encoding="utf-8") as f:
+                previous = json.load(f)["files"]
+            names, deleted = _diff_manifest(entries, previous, hash_files)
+            logger.info(f"Incremental: {len(names)} new/changed, {len(deleted)} deleted, "
+                        f"{len(entries) - len(names)} unchanged.")
+        members = [(entries[name]["path"], name) for name in names]
+        _compress_python(members, output_filename, codec, level, threads, block_size_mb,
+                         deleted, seekable)
+        base = os.path.basename(incremental_from) if incremental_from else None
+        _save_manifest(_manifest_path(output_filename), entries, base, hash_files)
+        logger.info(f"Successfully created '{output_filename}'.")
+        return
+
     # Composing the tar command
-    tar_command = ['tar', '-czvf', output_filename, '-C',
-                   os.path.dirname(directory_path), os.path.basename(directory_path)]
+    tar_command = ['tar', '-czf', output_filename, '-C',
+                   os.path.dirname(directory_path) or '.', os.path.basename(directory_path)]
 
     # Run the tar command using subprocess
     try:
@@ -51,5 +245,99 @@ def compress_directory(directory_path: str, output_filename: Optional[str] = Non
         logger.error(f"Failed to compress directory: {e}")
 
 
+def _safe_remove(output_dir: str, arcname: str) -> None:
+    target = os.path.realpath(os.path.join(output_dir, arcname))
+    root = os.path.realpath(output_dir)
+    if os.path.commonpath([root, target]) != root:
+        logger.warning(f"Ignoring deletion outside the output directory: {arcname}")
+        return
+    if os.path.isdir(target) and not os.path.islink(target):
+        shutil.rmtree(target)
+    elif os.path.lexists(target):
+        os.remove(target)
+
+
+def restore(output_dir: str, *archives: str) -> None:
+    """
+    Restore a base archive followed by its incremental deltas, in order.
+
+    :param output_dir: Directory to extract into.
+    :param archives: Base archive, then each delta produced with incremental_from.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for archive in archives:
+        deleted: List[str] = []
+        with open(archive, "rb") as raw, open_reader(raw, codec_for(archive)) as stream, \
+                tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if member.name == DELETED_MEMBER:
+                    deleted = json.loads(tar.extractfile(member).read().decode("utf-8"))
+                    continue
+                # "tar" rather than "data": backups routinely hold absolute symlinks.
+                try:
+                    tar.extract(member, output_dir, filter="tar")
+                except tarfile.FilterError as e:
+                    logger.warning(f"Skipping '{member.name}' from '{archive}': {e}")
+        for arcname in deleted:
+            _safe_remove(output_dir, arcname)
+        logger.info(f"Applied '{archive}' ({len(deleted)} deletion(s)).")
+
+
+def _extract_at(archive: str, codec: str, offset: int, name: str, output_dir: str) -> None:
+    """Decompress from offset and extract the single tar member that starts there."""
+    with open(archive, "rb") as raw:
+        raw.seek(offset)
+        with open_reader(raw, codec) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+            member = tar.next()
+            if member is None or member.name != name:
+                raise ValueError(f"Index does not match archive at offset {offset} ({name}).")
+            tar.extract(member, output_dir, filter="tar")  # as in restore
+
+
+def extract(archive: str, *members: str, output_dir: str = ".", workers: Optional[int] = None) -> None:
+    """
+    Extract members of a seekable archive without decompressing the rest of it.
+
+    :param archive: Archive written with seekable=True (its .index.json must sit beside it).
+    :param members: Paths inside the archive; a directory selects everything under it.
+        Default: all members.
+    :param output_dir: Directory to extract into.
+    :param workers: Members decompressed in parallel. Default: CPU count.
+    """
+    with open(archive + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    offsets: Dict[str, int] = index["members"]
+    selected = [name for name in offsets
+                if not members or any(name == m.rstrip("/") or name.startswith(m.rstrip("/") + "/")
+                                      for m in members)]
+    if not selected:
+        logger.error(f"No matching members in '{archive}'.")
+        return
+    # Create parent directories up front so parallel extractions don't race on them.
+    for name in selected:
+        os.makedirs(os.path.join(output_dir, os.path.dirname(name)), exist_ok=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {name: pool.submit(_extract_at, archive, index["codec"], offsets[name], name,
+                                     output_dir) for name in selected}
+    failed = 0
+    for name, fut in futures.items():
+        try:
+            fut.result()
+        except Exception as e:
+            failed += 1
+            logger.error(f"Failed to extract {name}: {e}")
+    logger.info(f"Extracted {len(selected) - failed} member(s) in "
+                f"{time.perf_counter() - start:.2f}s ({failed} failed).")
+
+
+# Sub-commands selected by the first CLI argument; anything else is the
+# original compress form, so existing invocations keep working.
+COMMANDS = {"restore": restore, "extract": extract}
+
+
 if __name__ == "__main__":
-    fire.Fire(compress_directory)
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        fire.Fire(COMMANDS[sys.argv[1]], command=sys.argv[2:])
+    else:
+        fire.Fire(compress_directory)
@@ -1,34 +1,130 @@
+import codecs
+import copy
+import fnmatch
+import json
 import os
-import chardet
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Set, Tuple
+from chardet import UniversalDetector
 import fire
 from loguru import logger
 
+DEFAULT_EXTENSIONS = ".cpp,.h"
+CHUNK_SIZE = 1 << 20
+# Files known to be in a target encoding, keyed by (device, inode, size, mtime).
+CACHE_NAME = ".encoding_cache.json"
 
-def detect_and_convert_encoding(file_path: str, target_encoding: str) -> bool:
+
+def _split_list(value) -> List[str]:
+    """Accept a comma-separated string or a list (Fire parses both)."""
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def detect_encoding(
+    file_path: str,
+    min_confidence: float = 0.9,
+    sample_size: int = 64 << 10,
+    chunk_size: int = 16 << 10,
+) -> Tuple[Optional[str], float]:
     """
-    Detects and converts the file's encoding to the target encoding.
+    Detect a file's encoding from a leading sample rather than the whole file.
 
-    :param file_path: Path to the file to process.
-    :param target_encoding: The desired encoding for the file.
-    :return: True if conversion was successful, False otherwise.
+    UniversalDetector is fed chunk by chunk, each byte once, and stops early
+    once it is sure. Since close() is final, the result is checked on a copy
+    of the detector each time the sample passes sample_size, 4x sample_size,
+    16x ...; sampling stops there once confidence reaches min_confidence.
+
+    :return: (encoding or None, confidence).
     """
-    # Read the binary content of the file
-    with open(file_path, 'rb') as f:
-        raw_data = f.read()
+    detector = UniversalDetector()
+    checkpoint = sample_size
+    fed = 0
+    with open(file_path, "rb") as f:
+        while not detector.done:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            detector.feed(chunk)
+            fed += len(chunk)
+            if fed >= checkpoint:
+                peek = copy.deepcopy(detector).close()
+                if (peek["confidence"] or 0.0) >= min_confidence:
+                    return peek["encoding"], peek["confidence"]
+                checkpoint *= 4
+    result = detector.close()
+    return result["encoding"], result["confidence"] or 0.0
+
+
+def _decodes_as(file_path: str, encoding: str, chunk_size: int = CHUNK_SIZE) -> bool:
+    """True if the whole file decodes with encoding, checked chunk by chunk."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
 
-    # Attempt to decode using the target encoding
+
+def _transcode(file_path: str, source: str, target: str, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Re-encode file_path from source to target with incremental codecs, writing a
+    temporary file beside it that atomically replaces the original. Memory use is
+    bounded by chunk_size, and a crash leaves the original untouched.
+    Symlinks are followed (the target is converted and the link kept), mode and,
+    where permitted, ownership are preserved. Hardlinked files are rewritten in
+    place instead, so every link sees the new content.
+    Raises UnicodeDecodeError / UnicodeEncodeError with the original unchanged.
+    """
+    real_path = os.path.realpath(file_path)
+    st = os.stat(real_path)
+    decoder = codecs.getincrementaldecoder(source)()
+    encoder = codecs.getincrementalencoder(target)()
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(real_path)}.",
+                                    suffix=".tmp", dir=os.path.dirname(real_path))
     try:
-        raw_data.decode(target_encoding)
+        with open(fd, 'wb') as out, open(real_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                out.write(encoder.encode(decoder.decode(chunk)))
+            out.write(encoder.encode(decoder.decode(b"", final=True), final=True))
+            out.flush()
+            os.fsync(out.fileno())
+        if st.st_nlink > 1:
+            # Replacing would detach this name from its other links.
+            shutil.copyfile(tmp_path, real_path)
+            os.unlink(tmp_path)
+            return
+        shutil.copymode(real_path, tmp_path)
+        if hasattr(os, "chown"):
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except OSError:
+                pass  # not permitted; the file is owned by whoever runs this
+        os.replace(tmp_path, real_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _convert_file(file_path: str, target_encoding: str, min_confidence: float = 0.9) -> str:
+    """Convert one file; returns "skipped", "converted" or "failed"."""
+    # Check whether the file is already in the target encoding
+    if _decodes_as(file_path, target_encoding):
         logger.info(
             f"✓ {file_path} is already in {target_encoding} encoding, skipping")
-        return False
-    except UnicodeDecodeError:
-        pass  # Decoding failed with the target encoding
+        return "skipped"
 
     # Detect the current file encoding
-    detection = chardet.detect(raw_data)
-    detected_encoding = detection['encoding']
-    confidence = detection['confidence']
+    detected_encoding, confidence = detect_encoding(file_path, min_confidence)
     logger.info(
         f"Detected {file_path} possible encoding: {detected_encoding} (confidence: {confidence:.2f})")
 
@@ -38,11 +134,11 @@ def detect_and_convert_encoding(file_path: str, target_encoding: str) -> bool:
         'iso-8859-1': 'latin_1',
         'ascii': 'utf-8'  # ASCII is a subset of UTF-8
     }
-    detected_encoding = encoding_mapping.get(
-        detected_encoding.lower(), detected_encoding)
+    if detected_encoding:
+        detected_encoding = encoding_mapping.get(
+            detected_encoding.lower(), detected_encoding)
 
-    # Attempt to decode using various encodings
-    decoded = None
+    # Attempt to transcode from various encodings
     try_encodings = [detected_encoding] if detected_encoding else []
     try_encodings += ['gbk', 'utf-8', 'latin_1', 'cp1252', 'big5', 'shift_jis']
 
@@ -50,56 +146,177 @@ def detect_and_convert_encoding(file_path: str, target_encoding: str) -> bool:
         if not enc:
             continue
         try:
-            decoded = raw_data.decode(enc)
-            logger.info(f"Successfully decoded using {enc}")
-            break
+            _transcode(file_path, enc, target_encoding)
         except (UnicodeDecodeError, LookupError):
             continue
+        except UnicodeEncodeError as e:
+            logger.error(f"× Encoding failed: {str(e)}")
+            return "failed"
+        except OSError as e:
+            logger.error(f"× File write failed: {str(e)}")
+            return "failed"
+        logger.info(
+            f"☆ Successfully converted {file_path} from {enc} to {target_encoding}")
+        return "converted"
 
-    if not decoded:
-        logger.error(
-            f"× Failed to decode {file_path}, all supported encodings tried")
-        return False
+    logger.error(
+        f"× Failed to decode {file_path}, all supported encodings tried")
+    return "failed"
+
+
+def detect_and_convert_encoding(file_path: str, target_encoding: str, min_confidence: float = 0.9) -> bool:
+    """
+    Detects and converts the file's encoding to the target encoding.
 
-    # Convert to target encoding
+    :param file_path: Path to the file to process.
+    :param target_encoding: The desired encoding for the file.
+    :param min_confidence: Detection confidence at which sampling stops (see detect_encoding).
+    :return: True if conversion was successful, False otherwise.
+    """
+    return _convert_file(file_path, target_encoding, min_confidence) == "converted"
+
+
+def _cache_key(st: os.stat_result) -> str:
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _process_file(file_path: str, target_encoding: str, min_confidence: float) -> Tuple[str, Optional[str]]:
+    """Worker: (status, cache key of the file once it is in the target encoding, or None)."""
     try:
-        encoded_data = decoded.encode(target_encoding)
-    except UnicodeEncodeError as e:
-        logger.error(f"× Encoding failed: {str(e)}")
-        return False
+        status = _convert_file(file_path, target_encoding, min_confidence)
+        if status == "failed":
+            return status, None
+        return status, _cache_key(os.stat(file_path))
+    except Exception as e:
+        # One unreadable file must not stop the batch.
+        logger.error(f"× Failed to process {file_path}: {e}")
+        return "failed", None
+
 
-    # Write back to the file
+def _load_cache(cache_path: str, encoding: str) -> Set[str]:
     try:
-        with open(file_path, 'wb') as f:
-            f.write(encoded_data)
-        logger.info(
-            f"☆ Successfully converted {file_path} to {target_encoding}")
-        return True
-    except IOError as e:
-        logger.error(f"× File write failed: {str(e)}")
-        return False
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return set(json.load(f).get(encoding, []))
+    except (OSError, ValueError):
+        return set()
 
 
-def process_directory(directory: str, target_encoding: str) -> None:
+def _save_cache(cache_path: str, encoding: str, keys: Set[str]) -> None:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[encoding] = sorted(keys)
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, cache_path)
+
+
+def _collect_files(directory: str, extensions: List[str], include: List[str], exclude: List[str]) -> List[str]:
+    """
+    Files under directory whose name ends with one of extensions (any, if empty)
+    and whose path relative to directory matches an include glob (if given) and
+    no exclude glob. Excluded directories are not descended into.
+    """
+    def excluded(rel_path: str) -> bool:
+        return any(fnmatch.fnmatch(rel_path, pattern) for pattern in exclude)
+
+    matches = []
+    for root, dirs, files in os.walk(directory):
+        rel_root = os.path.relpath(root, directory)
+        dirs[:] = [d for d in dirs if not excluded(os.path.normpath(os.path.join(rel_root, d)))]
+        for filename in files:
+            rel_path = os.path.normpath(os.path.join(rel_root, filename))
+            if extensions and not filename.endswith(tuple(extensions)):
+                continue
+            if include and not any(fnmatch.fnmatch(rel_path, pattern) for pattern in include):
+                continue
+            if not excluded(rel_path):
+                matches.append(os.path.join(root, filename))
+    return sorted(matches)
+
+
+def process_directory(
+    directory: str,
+    target_encoding: str,
+    extensions=DEFAULT_EXTENSIONS,
+    include=None,
+    exclude=None,
+    workers: Optional[int] = None,
+    min_confidence: float = 0.9,
+    cache: bool = True,
+) -> None:
     """
     Processes all files in a directory to convert their encoding.
 
     :param directory: Path to the directory to process.
     :param target_encoding: The desired encoding format for the files.
+    :param extensions: Comma-separated file name suffixes to process; empty for all files.
+    :param include: Comma-separated globs; if given, only matching relative paths are processed.
+    :param exclude: Comma-separated globs for relative paths (files or directories) to skip.
+    :param workers: Processes converting files in parallel. Default is the CPU count.
+    :param min_confidence: Detection confidence at which sampling stops.
+    :param cache: Skip files recorded in directory/.encoding_cache.json as already in
+        the target encoding, unless their device, inode, size or mtime changed.
     """
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            if filename.endswith(('.cpp', '.h')):
-                file_path = os.path.join(root, filename)
-                detect_and_convert_encoding(file_path, target_encoding)
+    files = _collect_files(directory, _split_list(extensions), _split_list(include),
+                           _split_list(exclude) + [CACHE_NAME])
+    cache_path = os.path.join(directory, CACHE_NAME)
+    encoding_name = codecs.lookup(target_encoding).name
+    known = _load_cache(cache_path, encoding_name) if cache else set()
+    keys = {}
+    for path in list(files):
+        try:
+            keys[path] = _cache_key(os.stat(path))
+        except OSError as e:  # e.g. a dangling symlink
+            logger.warning(f"Skipping unreadable {path}: {e}")
+            files.remove(path)
+    todo = [path for path in files if keys[path] not in known]
+    logger.info(f"Found {len(files)} file(s) to check, {len(files) - len(todo)} cached as "
+                f"{target_encoding}")
+
+    process = partial(_process_file, target_encoding=target_encoding,
+                      min_confidence=min_confidence)
+    if workers == 1:
+        results = list(map(process, todo))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Source files are small; batching keeps per-task IPC overhead down.
+            results = list(pool.map(process, todo, chunksize=32))
+
+    statuses = [status for status, _ in results]
+    if cache:
+        # Keep only files seen in this run, so entries for deleted or edited files expire.
+        current = {keys[path] for path in files if keys[path] in known}
+        current.update(key for _, key in results if key)
+        _save_cache(cache_path, encoding_name, current)
+    logger.info(f"Converted {statuses.count('converted')}, already {target_encoding} "
+                f"{statuses.count('skipped')}, failed {statuses.count('failed')}")
 
 
-def main(directory: str, encoding: str = 'utf-8') -> None:
+def main(
+    directory: str,
+    encoding: str = 'utf-8',
+    extensions=DEFAULT_EXTENSIONS,
+    include=None,
+    exclude=None,
+    workers: Optional[int] = None,
+    min_confidence: float = 0.9,
+    cache: bool = True,
+) -> None:
     """
     Main function to start processing the directory.
 
     :param directory: The directory path to process.
     :param encoding: The target encoding format (default: utf-8).
+    :param extensions: Comma-separated file name suffixes (default: .cpp,.h); empty for all.
+    :param include: Comma-separated globs of relative paths to process, e.g. "src/*".
+    :param exclude: Comma-separated globs of relative paths to skip, e.g. "third_party,*.gen.h".
+    :param workers: Number of worker processes (default: CPU count; 1 runs in-process).
+    :param min_confidence: Stop sampling a file once detection reaches this confidence.
+    :param cache: Use the skip cache in directory/.encoding_cache.json (default: True).
     """
     if not os.path.isdir(directory):
         logger.error(f"Error: {directory} is not a valid directory")
@@ -107,7 +324,8 @@ def main(directory: str, encoding: str = 'utf-8') -> None:
 
     print(
         f"{'='*40}\nStarting processing of directory: {directory}\nTarget encoding: {encoding}\n{'='*40}")
-    process_directory(directory, encoding)
+    process_directory(directory, encoding, extensions, include, exclude, workers, min_confidence,
+                      cache)
     print(f"{'='*40}\nProcessing completed\n{'='*40}")
 
 